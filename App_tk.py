@@ -1,15 +1,20 @@
 import tkinter as tk
 from tkinter import filedialog, Label, Button, Text, Scrollbar, Canvas, Toplevel, Entry
 from PIL import Image, ImageTk
-import requests
 import os
-import uuid
 import base64
 from io import BytesIO
 import cv2
 import numpy as np
 import threading
+import time
+import queue
 import json
+from concurrent.futures import ThreadPoolExecutor
+from client_transport import create_session, FramePipeline, WebSocketFramePipeline
+from ui_queue import UIUpdateQueue
+from thumbnail_cache import get_thumbnail_path
+from frame_gate import FrameChangeGate
 
 API_IMAGE_URL = "http://127.0.0.1:5000/detect/image/"
 API_VIDEO_URL = "http://127.0.0.1:5000/detect/video/"
@@ -17,14 +22,36 @@ API_GET_IMAGES_URL = "http://127.0.0.1:5000/images/"
 API_DELETE_IMAGE_URL = "http://127.0.0.1:5000/images/"
 API_UPDATE_IMAGE_URL = "http://127.0.0.1:5000/images/"
 API_SAVE_IMAGE_URL = "http://127.0.0.1:5000/save_image/"
+API_CAPTURE_URL = "http://127.0.0.1:5000/capture/"
+# Kênh WebSocket chỉ có khi chạy server bằng asgi_app.py
+API_WS_URL = "ws://127.0.0.1:5000/ws/detect"
+# Cách gửi frame camera/video: "http" (mỗi frame một request) hoặc "ws" (một kết nối WebSocket)
+FRAME_TRANSPORT = os.environ.get("FRAME_TRANSPORT", "http")
 STATIC_DIR = "static_img"
 BACKGROUND_IMAGE_PATH = "images/a.jpg"
+# Số request frame tối đa đang chờ server trả lời
+MAX_IN_FLIGHT = 3
+# Tần số cập nhật giao diện tối đa khi chạy camera/video (lần/giây)
+UI_REFRESH_HZ = 30
+# FPS dùng khi file video không ghi FPS (CAP_PROP_FPS = 0)
+DEFAULT_VIDEO_FPS = 30
+# Ngưỡng thay đổi (chênh lệch trung bình mỗi pixel, 0-255) để gửi frame mới; 0 = gửi mọi frame
+FRAME_DIFF_THRESHOLD = 4.0
+# Số ảnh đã lưu tải về mỗi lần gọi /images/
+IMAGES_PAGE_SIZE = 50
+THUMBNAIL_SIZE = (80, 60)
+# Mỗi thumbnail chiếm một ô cố định trên thanh cuộn (ảnh 80px + lề)
+THUMBNAIL_SLOT_WIDTH = 90
+# Số thumbnail dựng thêm ở hai bên vùng đang nhìn thấy
+THUMBNAIL_OVERSCAN = 3
 
 class AppWithYolo:
     def __init__(self, root):
         self.root = root
         self.root.title("App lỏ by Tiến and Dương")
         self.root.geometry("1000x600")
+        # Session keep-alive dùng chung cho mọi lời gọi API
+        self.session = create_session(pool_size=MAX_IN_FLIGHT + 1)
 
         self.main_frame = tk.Frame(root, bg="#f0f0f0")
         self.main_frame.pack(fill="both", expand=True)
@@ -65,12 +92,10 @@ class AppWithYolo:
         self.thumbnail_canvas.pack(fill="x", expand=True)
 
         self.thumbnail_scrollbar = Scrollbar(self.thumbnail_frame, orient="horizontal",
-                                             command=self.thumbnail_canvas.xview)
+                                             command=self.scroll_thumbnails)
         self.thumbnail_scrollbar.pack(fill="x")
         self.thumbnail_canvas.config(xscrollcommand=self.thumbnail_scrollbar.set)
-
-        self.thumbnail_inner_frame = tk.Frame(self.thumbnail_canvas, bg="#f0f0f0")
-        self.thumbnail_canvas.create_window((0, 0), window=self.thumbnail_inner_frame, anchor="nw")
+        self.thumbnail_canvas.bind("<Configure>", self.refresh_visible_thumbnails)
 
         self.result_frame = tk.Frame(self.content_frame, bg="#f0f0f0")
         self.result_frame.pack(fill="x", pady=(5, 0))
@@ -156,17 +181,41 @@ class AppWithYolo:
 
         # Biến lưu dữ liệu ảnh hiện tại (base64)
         self.current_image_data = None
+        # Frame hiện tại (numpy BGR, đã vẽ khung) khi chạy camera/video
+        self.current_frame = None
+        # result_id server trả về cho lần nhận diện hiện tại, dùng để lưu ảnh phía server
+        self.current_result_id = None
         # Biến lưu danh sách ảnh đã lưu và chỉ số ảnh hiện tại
         self.captured_images = []
         self.current_image_index = -1
-        # Danh sách để lưu tham chiếu đến các thumbnail
-        self.thumbnail_labels = []
+        # after_id để lấy trang ảnh tiếp theo, None khi đã tải hết
+        self.next_after_id = None
+        # Đang tải trang ảnh tiếp theo trong nền (chỉ một request trang cùng lúc)
+        self.page_loading = False
+        # Chuyển sang ảnh tiếp theo khi trang đang tải về xong (bấm "tiếp" ở ảnh cuối)
+        self.advance_after_page = False
+        # id các ảnh đang được tải detections trong nền
+        self.detections_loading = set()
+        # Các thumbnail đang được dựng: chỉ số ảnh -> (id cửa sổ canvas, frame, label ảnh, label ID)
+        self.thumbnail_widgets = {}
+        # Tăng mỗi lần danh sách thumbnail thay đổi để bỏ các kết quả tải cũ
+        self.thumbnail_generation = 0
+        self.thumbnail_placeholder = ImageTk.PhotoImage(Image.new("RGB", THUMBNAIL_SIZE, "#dddddd"))
+        # Thumbnail và trang ảnh tiếp theo được tải trong thread nền, thread Tk lấy kết quả qua hàng đợi
+        self.thumbnail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnail")
+        self.thumbnail_results = queue.Queue()
+        self.poll_thumbnail_results()
         # Biến để kiểm soát live camera và video
         self.camera_running = False
         self.video_running = False
         self.cap = None
         # Biến lưu detections hiện tại để sử dụng khi chụp lại
         self.current_detections = []
+        # Detections gần nhất của thread worker, dùng lại cho các frame không gửi lên server
+        self.gate_detections = None
+        # Thread worker chỉ đẩy cập nhật vào hàng đợi, thread Tk lấy ra và vẽ
+        self.ui_updates = UIUpdateQueue(self.root, self.apply_ui_update, refresh_hz=UI_REFRESH_HZ)
+        self.ui_updates.start()
 
     
     def set_background_image(self): # Đặt ảnh nền cho canvas
@@ -203,6 +252,7 @@ class AppWithYolo:
             return
 
         self.camera_running = True
+        self.gate_detections = None
         self.btn_live_camera.pack_forget()
         self.btn_stop_camera.pack(fill="x", pady=2, padx=5)
         self.btn_select_image.config(state="disabled")
@@ -236,42 +286,86 @@ class AppWithYolo:
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "Camera đã dừng.")
 
-    def process_camera(self):  # Xử lý camera
+    def process_camera(self):  # Xử lý camera (chạy trong thread worker, không gọi trực tiếp widget Tk)
+        cap = self.cap
+        pipeline = self.create_frame_pipeline()
+        gate = FrameChangeGate(FRAME_DIFF_THRESHOLD)
         while self.camera_running:
-            ret, frame = self.cap.read()
+            ret, frame = cap.read()
             if not ret:
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, "Không thể đọc frame từ camera!")
+                self.ui_updates.put("message", "Không thể đọc frame từ camera!")
                 break
 
-            _, buffer = cv2.imencode(".jpg", frame)
-            files = {"file": ("frame.jpg", buffer.tobytes(), "image/jpeg")}
+            # Không chờ response: frame bị bỏ nếu đã đủ số request đang chờ
+            self.send_or_reuse_frame(pipeline, gate, frame, "camera")
+
+        pipeline.close()
+        cap.release()
+
+    def create_frame_pipeline(self): # Tạo pipeline gửi frame theo FRAME_TRANSPORT, dùng HTTP nếu không kết nối được WebSocket
+        params = {"format": "detections"}
+        if FRAME_TRANSPORT == "ws":
             try:
-                response = requests.post(API_IMAGE_URL, files=files)
-                if response.status_code == 200:
-                    data = response.json()
-                    image_base64 = data["image_data"]
-                    detections = data.get("detections", [])
-                    self.current_image_data = image_base64
-                    self.current_detections = detections
-                    self.show_image_from_base64(image_base64)
-                    self.show_detections(detections, "camera")
-                    self.btn_capture.config(state="normal")
-                else:
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Lỗi từ API: {response.status_code} - {response.text}")
-                    self.btn_capture.config(state="disabled")
+                return WebSocketFramePipeline(API_WS_URL, MAX_IN_FLIGHT, params=params)
             except Exception as e:
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, f"Lỗi: {str(e)}")
+                self.ui_updates.put("message", f"Không kết nối được WebSocket, dùng HTTP: {str(e)}")
+        return FramePipeline(self.session, API_IMAGE_URL, MAX_IN_FLIGHT, params=params)
+
+    def send_or_reuse_frame(self, pipeline, gate, frame, file_type, block=False): # Gửi frame nếu cảnh thay đổi, nếu không dùng lại kết quả trước
+        changed, small = gate.changed(frame)
+        if changed or self.gate_detections is None:
+            if pipeline.submit(frame, block=block):
+                gate.mark_sent(small)
+        else:
+            # Cảnh gần như không đổi: không gửi frame, vẽ lại detections gần nhất
+            gate.mark_skipped()
+            self.push_frame(frame, self.gate_detections, file_type, None)
+
+        # Đã hiển thị frame mới hơn (bỏ qua) thì kết quả cũ chỉ dùng để cập nhật detections
+        detections = self.handle_frame_result(pipeline.get_latest(), file_type, render=gate.skipped == 0)
+        if detections is not None:
+            self.gate_detections = detections
+
+    def handle_frame_result(self, result, file_type, render=True): # Chuẩn bị kết quả mới nhất từ pipeline rồi đưa vào hàng đợi giao diện
+        if result is None:
+            return None
+        _, frame, data, error = result
+        if error is not None:
+            self.ui_updates.put("error", error)
+            return None
+        # Chỉ nhận kết quả, client tự vẽ khung lên frame đang có
+        detections = data.get("detections", [])
+        if render:
+            self.push_frame(frame, detections, file_type, data.get("result_id"))
+        return detections
+
+    def push_frame(self, frame, detections, file_type, result_id): # Vẽ khung và đưa frame vào hàng đợi giao diện
+        frame = self.draw_detections(frame, detections)
+        # Chuyển màu và co giãn ngay trong worker, thread Tk chỉ còn tạo PhotoImage
+        img = self.fit_to_canvas(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        self.ui_updates.put("frame", (frame, img, detections, file_type, result_id))
+
+    def apply_ui_update(self, kind, payload): # Áp dụng cập nhật giao diện (chỉ chạy trên thread Tk)
+        if kind == "video_end":
+            self.stop_video()
+            return
+        if not (self.camera_running or self.video_running):
+            return
+        if kind == "frame":
+            frame, img, detections, file_type, result_id = payload
+            self.current_frame = frame
+            self.current_result_id = result_id
+            self.current_image_data = None
+            self.current_detections = detections
+            self.display_fitted_image(img)
+            self.show_detections(detections, file_type)
+            self.btn_capture.config(state="normal")
+        elif kind in ("error", "message"):
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(tk.END, payload)
+            if kind == "error":
                 self.btn_capture.config(state="disabled")
 
-            self.root.update()
-            cv2.waitKey(30)
-
-        if self.cap:
-            self.cap.release()
-
     def select_image(self):   # Chọn ảnh
         if self.camera_running or self.video_running:
             return
@@ -296,6 +390,7 @@ class AppWithYolo:
             return
 
         self.video_running = True
+        self.gate_detections = None
         self.btn_stop_video.pack(side=tk.LEFT, padx=5)
         self.btn_select_image.config(state="disabled")
         self.btn_select_video.config(state="disabled")
@@ -329,51 +424,46 @@ class AppWithYolo:
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "Video đã dừng.")
 
-    def process_video(self): # Xử lý video
+    def process_video(self): # Xử lý video (chạy trong thread worker, không gọi trực tiếp widget Tk)
+        cap = self.cap
+        pipeline = self.create_frame_pipeline()
+        gate = FrameChangeGate(FRAME_DIFF_THRESHOLD)
+        # File video phát theo FPS của file (camera thì đã tự giới hạn theo tốc độ ghi hình)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / (fps if 0 < fps <= 240 else DEFAULT_VIDEO_FPS)
+        started = time.monotonic()
+        frame_index = 0
         while self.video_running:
-            ret, frame = self.cap.read()
+            ret, frame = cap.read()
             if not ret:
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, "Đã phát hết video hoặc lỗi khi đọc frame!")
-                self.stop_video()
+                # Đã phát hết video hoặc lỗi khi đọc frame
+                self.ui_updates.put("video_end")
                 break
 
-            _, buffer = cv2.imencode(".jpg", frame)
-            files = {"file": ("frame.jpg", buffer.tobytes(), "image/jpeg")}
-            try:
-                response = requests.post(API_IMAGE_URL, files=files)
-                if response.status_code == 200:
-                    data = response.json()
-                    image_base64 = data["image_data"]
-                    detections = data.get("detections", [])
-                    self.current_image_data = image_base64
-                    self.current_detections = detections
-                    self.show_image_from_base64(image_base64)
-                    self.show_detections(detections, "video")
-                    self.btn_capture.config(state="normal")
-                else:
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, f"Lỗi từ API: {response.status_code} - {response.text}")
-                    self.btn_capture.config(state="disabled")
-            except Exception as e:
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, f"Lỗi: {str(e)}")
-                self.btn_capture.config(state="disabled")
+            # Chờ tới thời điểm của frame; đang chậm hơn (chờ server) thì tính lại mốc để không phát dồn sau đó
+            delay = started + frame_index * frame_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                started -= delay
+            frame_index += 1
 
-            self.root.update()
-            cv2.waitKey(30)
+            # Với file video, chờ khi pipeline đầy để không bỏ qua frame
+            self.send_or_reuse_frame(pipeline, gate, frame, "video", block=True)
 
-        if self.cap:
-            self.cap.release()
+        pipeline.close()
+        cap.release()
 
     def process_file(self, file_path, api_url, file_type): # Xử lý file ảnh hoặc video
         try:
             with open(file_path, "rb") as file:
-                response = requests.post(api_url, files={"file": file})
+                response = self.session.post(api_url, files={"file": file})
 
             if response.status_code == 200:
                 data = response.json()
                 self.current_image_data = data["image_data"]
+                self.current_frame = None
+                self.current_result_id = data.get("result_id")
                 self.current_detections = data.get("detections", [])
                 self.show_image_from_base64(self.current_image_data)
                 self.show_detections(self.current_detections, file_type)
@@ -395,27 +485,41 @@ class AppWithYolo:
     def show_image_from_base64(self, image_base64): # Hiển thị ảnh từ base64
         try:
             image_data = base64.b64decode(image_base64)
-            img = Image.open(BytesIO(image_data))
-            original_width, original_height = img.size
+            self.show_pil_image(Image.open(BytesIO(image_data)))
+        except Exception as e:
+            self.label_img.config(image=None, text=f"Lỗi tải nội dung: {str(e)}")
 
-            canvas_ratio = self.canvas_width / self.canvas_height
-            image_ratio = original_width / original_height
+    def show_pil_image(self, img): # Co giãn ảnh PIL theo canvas và hiển thị
+        self.display_fitted_image(self.fit_to_canvas(img))
 
-            if image_ratio > canvas_ratio:
-                new_height = self.canvas_height
-                new_width = int(new_height * image_ratio)
-            else:
-                new_width = self.canvas_width
-                new_height = int(new_width / image_ratio)
+    def fit_to_canvas(self, img): # Co giãn ảnh PIL theo kích thước canvas (dùng được ngoài thread Tk)
+        original_width, original_height = img.size
 
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        canvas_ratio = self.canvas_width / self.canvas_height
+        image_ratio = original_width / original_height
 
-            img_tk = ImageTk.PhotoImage(img)
-            self.label_img.config(image=img_tk, text="")
-            self.label_img.image = img_tk
-            self.canvas.config(scrollregion=(0, 0, new_width, new_height))
-        except Exception as e:
-            self.label_img.config(image=None, text=f"Lỗi tải nội dung: {str(e)}")
+        if image_ratio > canvas_ratio:
+            new_height = self.canvas_height
+            new_width = int(new_height * image_ratio)
+        else:
+            new_width = self.canvas_width
+            new_height = int(new_width / image_ratio)
+
+        return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    def display_fitted_image(self, img): # Hiển thị ảnh đã co giãn lên canvas
+        img_tk = ImageTk.PhotoImage(img)
+        self.label_img.config(image=img_tk, text="")
+        self.label_img.image = img_tk
+        self.canvas.config(scrollregion=(0, 0, img.width, img.height))
+
+    def draw_detections(self, frame, detections): # Vẽ khung và nhãn lên frame (thay cho ảnh server trả về)
+        for detection in detections:
+            x1, y1, x2, y2 = detection["box"]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"{detection['label']} {detection['confidence']:.2f}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), 2)
+        return frame
 
     def show_detections(self, detections, file_type): # Hiển thị kết quả nhận diện
         self.result_text.delete(1.0, tk.END)
@@ -444,32 +548,35 @@ class AppWithYolo:
             if notes:
                 self.result_text.insert(tk.END, f"Ghi chú: {notes}\n")
 
-    def capture_image(self): # Lưu ảnh đã nhận diện
-        if not self.current_image_data:
+    def capture_image(self): # Lưu ảnh đã nhận diện (server ghi file và thêm bản ghi)
+        if not self.current_image_data and self.current_frame is None:
             self.result_text.delete(1.0, tk.END)
             self.result_text.insert(tk.END, "Không có ảnh để chụp lại!")
             return
 
-        new_filename = f"captured_{uuid.uuid4().hex}.jpg"
-        new_path = os.path.join(STATIC_DIR, new_filename)
-
         try:
-            image_data = base64.b64decode(self.current_image_data)
-            img = Image.open(BytesIO(image_data))
-            img.save(new_path)
-
-            detections_json = json.dumps(self.current_detections)
+            response = None
+            # Ưu tiên result_id: server đã giữ ảnh gốc nên không cần gửi lại ảnh
+            if self.current_result_id:
+                response = self.session.post(API_CAPTURE_URL, data={"result_id": self.current_result_id})
+            if response is None or response.status_code == 404:
+                # result_id đã hết hạn: gửi bytes ảnh đã vẽ khung
+                if self.current_frame is not None:
+                    _, buffer = cv2.imencode(".jpg", self.current_frame)
+                    image_bytes = buffer.tobytes()
+                else:
+                    image_bytes = base64.b64decode(self.current_image_data)
+                response = self.session.post(
+                    API_CAPTURE_URL,
+                    files={"file": ("capture.jpg", image_bytes, "image/jpeg")},
+                    data={"detections": json.dumps(self.current_detections)}
+                )
 
-            # Gọi API để lưu ảnh
-            response = requests.post(API_SAVE_IMAGE_URL, json={
-                "file_path": new_path,
-                "detections": detections_json
-            })
             if response.status_code == 200:
                 data = response.json()
                 image_id = data["image_id"]
                 self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, f"Đã lưu ảnh với ID: {image_id}\nĐường dẫn: {new_path}")
+                self.result_text.insert(tk.END, f"Đã lưu ảnh với ID: {image_id}\nĐường dẫn: {data['file_path']}")
             else:
                 self.result_text.delete(1.0, tk.END)
                 self.result_text.insert(tk.END, f"Lỗi từ API: {response.status_code} - {response.text}")
@@ -481,25 +588,20 @@ class AppWithYolo:
         if self.camera_running or self.video_running:
             return
         try:
-            # Gọi API GET để lấy danh sách ảnh
-            response = requests.get(API_GET_IMAGES_URL)
+            # Gọi API GET để lấy trang ảnh đầu tiên (không kèm detections, tải khi cần)
+            response = self.session.get(API_GET_IMAGES_URL, params={"limit": IMAGES_PAGE_SIZE, "include_detections": 0})
             if response.status_code == 200:
                 data = response.json()
                 images = data.get("images", [])
+                self.next_after_id = data.get("next_after_id")
 
                 self.result_text.delete(1.0, tk.END)
                 if not images:
-                    self.result_text.insert(tk.END, "Chưa có ảnh nào được lưu.")
-                    self.set_background_image()
-                    self.btn_prev.config(state="disabled")
-                    self.btn_next.config(state="disabled")
-                    self.btn_delete.config(state="disabled")
-                    self.btn_update_notes.config(state="disabled")
-                    self.clear_thumbnails()
+                    self.show_no_captured_images()
                     return
 
                 # Lưu danh sách ảnh đã lưu (bao gồm cả notes)
-                self.captured_images = [(img["id"], img["file_path"], img["detections"], img["notes"]) for img in images]
+                self.captured_images = [(img["id"], img["file_path"], img.get("detections"), img["notes"]) for img in images]
                 self.current_image_index = 0
 
                 # Hiển thị danh sách thumbnail
@@ -516,6 +618,71 @@ class AppWithYolo:
             self.result_text.delete(1.0, tk.END)
             self.result_text.insert(tk.END, f"Lỗi khi gọi API: {str(e)}")
 
+    def show_no_captured_images(self): # Danh sách ảnh đã lưu trống
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(tk.END, "Chưa có ảnh nào được lưu.")
+        self.set_background_image()
+        self.btn_prev.config(state="disabled")
+        self.btn_next.config(state="disabled")
+        self.btn_delete.config(state="disabled")
+        self.btn_update_notes.config(state="disabled")
+        self.clear_thumbnails()
+        self.current_image_index = -1
+
+    def load_more_images(self, advance=False): # Tải thêm một trang ảnh đã lưu trong nền, trả về True nếu đang tải
+        # advance: chuyển sang ảnh tiếp theo khi trang tải xong
+        if advance:
+            self.advance_after_page = True
+        if self.next_after_id is None or self.page_loading:
+            return self.page_loading
+        self.page_loading = True
+        self.thumbnail_executor.submit(self.fetch_image_page, self.next_after_id)
+        return True
+
+    def fetch_image_page(self, after_id): # Chạy trong thread nền: lấy trang ảnh sau after_id
+        try:
+            response = self.session.get(API_GET_IMAGES_URL, params={
+                "after_id": after_id,
+                "limit": IMAGES_PAGE_SIZE,
+                "include_detections": 0
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f"Lỗi từ API: {response.status_code} - {response.text}")
+            self.thumbnail_results.put(("page", after_id, response.json(), None))
+        except Exception as e:
+            self.thumbnail_results.put(("page", after_id, None, e))
+
+    def apply_image_page(self, after_id, data, error): # Thêm trang ảnh vừa tải vào danh sách (chạy trên thread Tk)
+        self.page_loading = False
+        advance, self.advance_after_page = self.advance_after_page, False
+        # Danh sách đã được tải lại từ đầu trong lúc chờ: bỏ trang cũ
+        if after_id != self.next_after_id:
+            return
+        if error is not None:
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(tk.END, f"Lỗi khi gọi API: {str(error)}")
+            return
+        images = data.get("images", [])
+        self.next_after_id = data.get("next_after_id")
+        was_empty = not self.captured_images
+        self.captured_images.extend((img["id"], img["file_path"], img.get("detections"), img["notes"]) for img in images)
+        if was_empty:
+            # Đã xóa hết ảnh của các trang trước
+            if not self.captured_images:
+                self.show_no_captured_images()
+                return
+            self.current_image_index = 0
+            self.display_thumbnails()
+            self.show_captured_image()
+        else:
+            total_width = len(self.captured_images) * THUMBNAIL_SLOT_WIDTH + 10
+            self.thumbnail_canvas.config(scrollregion=(0, 0, total_width, 90))
+            self.refresh_visible_thumbnails()
+            if advance and self.current_image_index < len(self.captured_images) - 1:
+                self.current_image_index += 1
+                self.show_captured_image()
+        self.update_navigation_buttons()
+
     def update_notes(self): # Cập nhật ghi chú cho ảnh đã lưu
         if self.current_image_index < 0 or self.current_image_index >= len(self.captured_images):
             return
@@ -534,7 +701,7 @@ class AppWithYolo:
             new_notes = notes_entry.get().strip()
             try:
                 # Gửi request PUT để cập nhật ghi chú
-                response = requests.put(f"{API_UPDATE_IMAGE_URL}{image_id}", json={"notes": new_notes})
+                response = self.session.put(f"{API_UPDATE_IMAGE_URL}{image_id}", json={"notes": new_notes})
                 if response.status_code == 200:
                     # Cập nhật lại danh sách captured_images
                     self.captured_images[self.current_image_index] = (
@@ -564,20 +731,19 @@ class AppWithYolo:
         image_id, _, _, _ = self.captured_images[self.current_image_index]
         try:
             # Gọi API DELETE để xóa ảnh
-            response = requests.delete(f"{API_DELETE_IMAGE_URL}{image_id}")
+            response = self.session.delete(f"{API_DELETE_IMAGE_URL}{image_id}")
             if response.status_code == 200:
                 # Xóa ảnh khỏi danh sách và cập nhật giao diện
                 self.captured_images.pop(self.current_image_index)
                 if not self.captured_images:
-                    self.result_text.delete(1.0, tk.END)
-                    self.result_text.insert(tk.END, "Chưa có ảnh nào được lưu.")
-                    self.set_background_image()
-                    self.btn_prev.config(state="disabled")
-                    self.btn_next.config(state="disabled")
-                    self.btn_delete.config(state="disabled")
-                    self.btn_update_notes.config(state="disabled")
-                    self.clear_thumbnails()
-                    self.current_image_index = -1
+                    if self.load_more_images():
+                        # Trang tiếp theo được hiển thị khi tải xong (apply_image_page)
+                        self.clear_thumbnails()
+                        self.current_image_index = -1
+                        self.result_text.delete(1.0, tk.END)
+                        self.result_text.insert(tk.END, f"Đã xóa ảnh với ID: {image_id}. Đang tải thêm ảnh...")
+                    else:
+                        self.show_no_captured_images()
                     return
 
                 # Điều chỉnh chỉ số ảnh hiện tại
@@ -597,40 +763,100 @@ class AppWithYolo:
             self.result_text.delete(1.0, tk.END)
             self.result_text.insert(tk.END, f"Lỗi khi gọi API: {str(e)}")
 
-    def display_thumbnails(self): # Hiển thị thumbnail của ảnh đã lưu
+    def display_thumbnails(self): # Hiển thị thanh thumbnail ảo: chỉ dựng widget cho phần đang nhìn thấy
         self.clear_thumbnails()
-        x_position = 5
-        thumbnail_size = (80, 60)
-        for idx, (image_id, file_path, _, _) in enumerate(self.captured_images):
-            try:
-                img = Image.open(file_path)
-                img = img.resize(thumbnail_size, Image.Resampling.LANCZOS)
-                img_tk = ImageTk.PhotoImage(img)
-
-                thumb_frame = tk.Frame(self.thumbnail_inner_frame, bg="#f0f0f0")
-                thumb_frame.grid(row=0, column=idx, padx=5)
-
-                thumb_label = Label(thumb_frame, image=img_tk, bg="#f0f0f0")
-                thumb_label.image = img_tk
-                thumb_label.pack()
+        total_width = len(self.captured_images) * THUMBNAIL_SLOT_WIDTH + 10
+        self.thumbnail_canvas.config(scrollregion=(0, 0, total_width, 90))
+        self.thumbnail_canvas.xview_moveto(0)
+        self.refresh_visible_thumbnails()
 
-                id_label = Label(thumb_frame, text=f"ID: {image_id}", font=("Arial", 8), bg="#f0f0f0", fg="#333")
-                id_label.pack()
+    def scroll_thumbnails(self, *args): # Cuộn thanh thumbnail rồi dựng lại phần đang nhìn thấy
+        self.thumbnail_canvas.xview(*args)
+        self.refresh_visible_thumbnails()
 
-                thumb_label.bind("<Button-1>", lambda event, index=idx: self.select_thumbnail(index))
+    def refresh_visible_thumbnails(self, event=None): # Dựng thumbnail trong vùng nhìn thấy, hủy các thumbnail đã ra ngoài
+        if not self.captured_images:
+            return
+        left = self.thumbnail_canvas.canvasx(0)
+        width = self.thumbnail_canvas.winfo_width()
+        # Gần cuối danh sách thì tải thêm trang tiếp theo
+        if int((left + width) // THUMBNAIL_SLOT_WIDTH) + THUMBNAIL_OVERSCAN >= len(self.captured_images):
+            self.load_more_images()
+        first = max(0, int(left // THUMBNAIL_SLOT_WIDTH) - THUMBNAIL_OVERSCAN)
+        last = min(len(self.captured_images), int((left + width) // THUMBNAIL_SLOT_WIDTH) + 1 + THUMBNAIL_OVERSCAN)
+
+        for idx in list(self.thumbnail_widgets):
+            if idx < first or idx >= last:
+                window_id, thumb_frame, _, _ = self.thumbnail_widgets.pop(idx)
+                self.thumbnail_canvas.delete(window_id)
+                thumb_frame.destroy()
+
+        for idx in range(first, last):
+            if idx not in self.thumbnail_widgets:
+                self.create_thumbnail_widget(idx)
+
+    def create_thumbnail_widget(self, idx): # Tạo ô thumbnail với ảnh tạm, ảnh thật được tải trong nền
+        image_id, file_path, _, _ = self.captured_images[idx]
+        thumb_frame = tk.Frame(self.thumbnail_canvas, bg="#f0f0f0")
+
+        thumb_label = Label(thumb_frame, image=self.thumbnail_placeholder, bg="#f0f0f0")
+        thumb_label.pack()
+
+        id_label = Label(thumb_frame, text=f"ID: {image_id}", font=("Arial", 8), bg="#f0f0f0", fg="#333")
+        id_label.pack()
+
+        thumb_label.bind("<Button-1>", lambda event, index=idx: self.select_thumbnail(index))
+
+        window_id = self.thumbnail_canvas.create_window((5 + idx * THUMBNAIL_SLOT_WIDTH, 5), window=thumb_frame, anchor="nw")
+        self.thumbnail_widgets[idx] = (window_id, thumb_frame, thumb_label, id_label)
+        self.thumbnail_executor.submit(self.load_thumbnail, self.thumbnail_generation, idx, image_id, file_path)
+
+    def load_thumbnail(self, generation, idx, image_id, file_path): # Chạy trong thread nền: lấy thumbnail từ cache đĩa hoặc API
+        if generation != self.thumbnail_generation or idx not in self.thumbnail_widgets:
+            return
+        try:
+            if os.path.exists(file_path):
+                img = Image.open(get_thumbnail_path(file_path, THUMBNAIL_SIZE))
+            else:
+                response = self.session.get(f"{API_GET_IMAGES_URL}{image_id}/thumbnail")
+                response.raise_for_status()
+                img = Image.open(BytesIO(response.content))
+            img.load()
+            self.thumbnail_results.put(("thumbnail", generation, idx, image_id, img, None))
+        except Exception as e:
+            self.thumbnail_results.put(("thumbnail", generation, idx, image_id, None, e))
 
-                self.thumbnail_labels.append((thumb_frame, thumb_label, id_label))
-            except Exception as e:
+    def poll_thumbnail_results(self): # Gắn thumbnail / trang ảnh đã tải vào giao diện (chạy trên thread Tk)
+        while True:
+            try:
+                kind, *result = self.thumbnail_results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "page":
+                self.apply_image_page(*result)
+                continue
+            if kind == "detections":
+                self.apply_detections(*result)
+                continue
+            generation, idx, image_id, img, error = result
+            if generation != self.thumbnail_generation or idx not in self.thumbnail_widgets:
+                continue
+            if error is not None:
                 self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, f"Lỗi khi tải ảnh ID {image_id}: {str(e)}")
-
-        self.thumbnail_inner_frame.update_idletasks()
-        self.thumbnail_canvas.config(scrollregion=self.thumbnail_canvas.bbox("all"))
+                self.result_text.insert(tk.END, f"Lỗi khi tải ảnh ID {image_id}: {str(error)}")
+                continue
+            img_tk = ImageTk.PhotoImage(img)
+            thumb_label = self.thumbnail_widgets[idx][2]
+            thumb_label.config(image=img_tk)
+            thumb_label.image = img_tk
+        self.root.after(50, self.poll_thumbnail_results)
 
     def clear_thumbnails(self): # Xóa thumbnail hiện tại
-        for thumb_frame, _, _ in self.thumbnail_labels:
+        for window_id, thumb_frame, _, _ in self.thumbnail_widgets.values():
+            self.thumbnail_canvas.delete(window_id)
             thumb_frame.destroy()
-        self.thumbnail_labels = []
+        self.thumbnail_widgets = {}
+        self.thumbnail_generation += 1
         self.thumbnail_canvas.config(scrollregion=(0, 0, 0, 0))
 
     def select_thumbnail(self, index): # Chọn thumbnail
@@ -643,6 +869,14 @@ class AppWithYolo:
             return
 
         image_id, file_path, detections, notes = self.captured_images[self.current_image_index]
+        if detections is None:
+            # Danh sách chỉ chứa thông tin cơ bản, lấy detections của ảnh trong nền rồi hiển thị lại
+            if image_id not in self.detections_loading:
+                self.detections_loading.add(image_id)
+                self.thumbnail_executor.submit(self.fetch_detections, image_id)
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(tk.END, f"Đang tải ảnh ID {image_id}...")
+            return
         try:
             img = Image.open(file_path)
             original_width, original_height = img.size
@@ -669,6 +903,29 @@ class AppWithYolo:
             self.result_text.delete(1.0, tk.END)
             self.result_text.insert(tk.END, f"Lỗi khi tải ảnh: {str(e)}")
 
+    def fetch_detections(self, image_id): # Chạy trong thread nền: lấy detections của một ảnh đã lưu
+        try:
+            response = self.session.get(f"{API_GET_IMAGES_URL}{image_id}")
+            response.raise_for_status()
+            self.thumbnail_results.put(("detections", image_id, response.json()["image"]["detections"], None))
+        except Exception as e:
+            self.thumbnail_results.put(("detections", image_id, None, e))
+
+    def apply_detections(self, image_id, detections, error): # Gắn detections vừa tải vào danh sách (chạy trên thread Tk)
+        self.detections_loading.discard(image_id)
+        if error is not None:
+            if self.captured_images and self.captured_images[self.current_image_index][0] == image_id:
+                self.result_text.delete(1.0, tk.END)
+                self.result_text.insert(tk.END, f"Lỗi khi tải ảnh ID {image_id}: {str(error)}")
+            return
+        for index, (entry_id, file_path, _, notes) in enumerate(self.captured_images):
+            if entry_id == image_id:
+                self.captured_images[index] = (image_id, file_path, detections, notes)
+                # Chỉ vẽ lại nếu người dùng vẫn đang xem ảnh này
+                if index == self.current_image_index:
+                    self.show_captured_image()
+                break
+
     def show_prev_image(self): # Hiển thị ảnh trước đó
         if self.current_image_index > 0:
             self.current_image_index -= 1
@@ -676,6 +933,10 @@ class AppWithYolo:
             self.update_navigation_buttons()
 
     def show_next_image(self): # Hiển thị ảnh tiếp theo
+        if self.current_image_index >= len(self.captured_images) - 1:
+            # Ảnh cuối của các trang đã tải: chuyển tiếp khi trang sau tải xong
+            self.load_more_images(advance=True)
+            return
         if self.current_image_index < len(self.captured_images) - 1:
             self.current_image_index += 1
             self.show_captured_image()
@@ -683,7 +944,8 @@ class AppWithYolo:
 
     def update_navigation_buttons(self): # Cập nhật trạng thái các nút điều hướng
         self.btn_prev.config(state="normal" if self.current_image_index > 0 else "disabled")
-        self.btn_next.config(state="normal" if self.current_image_index < len(self.captured_images) - 1 else "disabled")
+        has_next = self.current_image_index < len(self.captured_images) - 1 or self.next_after_id is not None
+        self.btn_next.config(state="normal" if has_next else "disabled")
         self.btn_delete.config(state="normal" if self.captured_images else "disabled")
         self.btn_update_notes.config(state="normal" if self.captured_images else "disabled")
 
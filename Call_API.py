@@ -1,27 +1,342 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file, g
+from werkzeug.exceptions import RequestEntityTooLarge
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import os
 import base64
-from io import BytesIO
 import uuid
-import sqlite3
 import json
+import hashlib
+import multiprocessing
+import threading
+import time
+import zipfile
+import tarfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from batcher import BatchScheduler
+from postprocess import extract_detections, filter_detections
+from thumbnail_cache import get_thumbnail_path
+from init_db import DB_PATH, init_db, insert_detections
+from db_pool import SQLitePool
+from lru_cache import LRUCache
+from inference_backend import MODEL_PATH, INFERENCE_BACKEND, INFERENCE_IMGSZ, load_model
+from result_cache import DetectionResultCache
+from worker_pool import ModelWorkerPool
+from adaptive_resolution import AdaptiveResolution, round_imgsz
+from ingest import decode_image, letterbox, unletterbox
+from jobs import JobQueue
+from admission import AdmissionController, AdmissionRejected, DeadlineExceeded, parse_deadline, check_deadline, remaining
+from metrics import Registry, Counter, Gauge, Histogram, timed, begin_timings, end_timings, server_timing_header
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 app = Flask(__name__)
-MODEL_PATH = "yolov8n.pt"
-if not os.path.exists(MODEL_PATH):
-    raise FileNotFoundError(f"Mô hình {MODEL_PATH} không tồn tại!")
-model = YOLO(MODEL_PATH)
+# Giới hạn kích thước body của mọi request (MB, 0 = không giới hạn); vượt quá trả 413
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", 1024))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024 if MAX_UPLOAD_MB > 0 else None
+
+# Metrics kiểu Prometheus (xem /metrics); SERVER_TIMING=1: thêm header Server-Timing với thời gian từng bước
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+registry = Registry()
+http_requests = Counter(registry, "http_requests_total", "Số request HTTP theo route, method và status", ("endpoint", "method", "status"))
+http_request_seconds = Histogram(registry, "http_request_duration_seconds", "Thời gian xử lý request HTTP", ("endpoint",))
+http_in_flight = Gauge(registry, "http_requests_in_flight", "Số request HTTP đang xử lý", ("endpoint",))
+detect_stage_seconds = Histogram(registry, "detect_stage_seconds", "Thời gian từng bước nhận diện (read, decode, inference, draw, encode, serialize...)", ("stage",))
+detect_errors = Counter(registry, "detect_errors_total", "Số lỗi khi nhận diện theo route và loại lỗi", ("endpoint", "error"))
+model_batch_size = Histogram(registry, "model_batch_size", "Số ảnh mỗi lần gọi model (worker pool: luôn 1)", buckets=(1, 2, 4, 8, 16, 32, 64))
+model_batch_seconds = Histogram(registry, "model_batch_seconds", "Thời gian mỗi lần gọi model")
+db_query_seconds = Histogram(registry, "db_query_seconds", "Thời gian truy vấn SQLite theo loại câu lệnh", ("operation",))
+inference_queue_depth = Gauge(registry, "inference_queue_depth", "Số ảnh đang chờ BatchScheduler / worker pool")
+detect_in_flight = Gauge(registry, "detect_requests_in_flight", "Số request nhận diện đang xử lý (dùng cho imgsz thích ứng)")
+cache_items = Gauge(registry, "cache_items", "Số phần tử trong cache", ("cache",))
+cache_hits = Counter(registry, "cache_hits_total", "Số lần cache hit", ("cache",))
+cache_misses = Counter(registry, "cache_misses_total", "Số lần cache miss", ("cache",))
+model_ready = Gauge(registry, "model_ready", "1 nếu model đã nạp xong")
+admission_in_flight = Gauge(registry, "admission_in_flight", "Số request nhận diện đã được nhận và đang xử lý")
+admission_rejected = Counter(registry, "admission_rejected_total", "Số request bị từ chối do quá tải theo status", ("status",))
+deadline_exceeded = Counter(registry, "deadline_exceeded_total", "Số request bị bỏ vì quá thời hạn", ("endpoint",))
+
+def stage(name): # Đo thời gian một bước nhận diện: with stage("decode"): ...
+    return timed(detect_stage_seconds, name)
+
+def observe_model_batch(batch_size, seconds):
+    model_batch_size.observe(batch_size)
+    model_batch_seconds.observe(seconds)
+
+# INFERENCE_WORKERS > 0: chạy model trong N process riêng (mỗi process WORKER_THREADS thread)
+# thay vì model dùng chung trong process Flask
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0))
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 1))
+WORKER_SLOT_MB = int(os.environ.get("WORKER_SLOT_MB", 8))
+WORKER_PIN_CPUS = os.environ.get("WORKER_PIN_CPUS", "0") == "1"
+WORKER_TIMEOUT = float(os.environ.get("WORKER_TIMEOUT", 30))
+
+# Cấu hình gom batch cho /detect/image/
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+
+# Admission control cho các route nhận diện: số request tối đa đang xử lý (toàn server / mỗi client, 0 = không giới hạn)
+# Vượt giới hạn: trả 503 / 429 ngay kèm Retry-After thay vì xếp hàng chờ model
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 64))
+ADMISSION_MAX_PER_CLIENT = int(os.environ.get("ADMISSION_MAX_PER_CLIENT", 8))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 1))
+# Thời hạn mặc định của request nhận diện (ms, 0 = không có); client đặt riêng bằng header X-Request-Deadline-Ms
+DETECT_DEADLINE_MS = float(os.environ.get("DETECT_DEADLINE_MS", 0))
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_PER_CLIENT, ADMISSION_RETRY_AFTER)
+ADMISSION_ENDPOINTS = {"detect_image", "detect_video", "detect_batch"}
+
+# Cách nạp model: background (nạp ngay trong thread nền), lazy (nạp ở request nhận diện đầu tiên),
+# off (replica chỉ phục vụ CRUD ảnh, không nạp model)
+MODEL_LOADING = os.environ.get("MODEL_LOADING", "background").lower()
+# Số lần chạy thử với ảnh giả kích thước WARMUP_SIZE (rộng x cao) sau khi nạp model
+WARMUP_RUNS = int(os.environ.get("WARMUP_RUNS", 2))
+WARMUP_SIZE = tuple(int(v) for v in os.environ.get("WARMUP_SIZE", "640x480").lower().split("x"))
+
+# Chỉ process phục vụ request mới nạp model và chạy job nền: process worker (spawn) import lại file này,
+# còn `python Call_API.py` (debug=True) có reloader của Werkzeug - process cha chỉ theo dõi file,
+# process con (WERKZEUG_RUN_MAIN=true) mới phục vụ request
+# Khi process spawn import lại module chính, parent_process() vẫn là None nhưng tên process đã được đặt
+SERVING_PROCESS = (multiprocessing.parent_process() is None
+                   and not multiprocessing.current_process().name.startswith("model-worker-")
+                   and (__name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true"))
+
+class ModelUnavailable(Exception):
+    pass
+
+model = None
+batcher = None
+worker_pool = None
+model_lock = threading.Lock()
+model_state = {"status": "disabled" if MODEL_LOADING == "off" else "not_loaded", "error": None, "load_seconds": None}
+
+def ensure_model(): # Nạp model nếu chưa có (an toàn khi nhiều thread gọi cùng lúc)
+    global model, batcher, worker_pool
+    if model_state["status"] == "ready":
+        return
+    if MODEL_LOADING == "off":
+        raise ModelUnavailable("Replica này không nạp model (MODEL_LOADING=off)")
+    with model_lock:
+        if model_state["status"] == "ready":
+            return
+        model_state["status"] = "loading"
+        started = time.perf_counter()
+        try:
+            if INFERENCE_BACKEND != "stub" and not os.path.exists(MODEL_PATH):
+                raise FileNotFoundError(f"Mô hình {MODEL_PATH} không tồn tại!")
+            # Lần thử lại sau lỗi warm-up dùng lại model / pool đã tạo
+            if INFERENCE_WORKERS > 0 and worker_pool is None:
+                worker_pool = ModelWorkerPool(INFERENCE_WORKERS, MODEL_PATH, INFERENCE_BACKEND, INFERENCE_IMGSZ,
+                                              threads_per_worker=WORKER_THREADS, slot_bytes=WORKER_SLOT_MB * 1024 * 1024,
+                                              pin_cpus=WORKER_PIN_CPUS, on_batch=observe_model_batch)
+            elif INFERENCE_WORKERS == 0 and model is None:
+                # Backend chọn qua INFERENCE_BACKEND (pytorch / onnx / openvino), các route không cần biết backend nào
+                model = load_model(MODEL_PATH, INFERENCE_BACKEND, INFERENCE_IMGSZ)
+                batcher = BatchScheduler(model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                                         on_batch=observe_model_batch)
+            warm_up()
+        except Exception as e:
+            model_state["status"] = "error"
+            model_state["error"] = str(e)
+            raise ModelUnavailable(f"Không thể nạp model: {e}")
+        model_state["load_seconds"] = round(time.perf_counter() - started, 3)
+        model_state["status"] = "ready"
+
+def warm_up(): # Chạy thử vài lần để request thật đầu tiên không phải trả chi phí khởi tạo
+    # Đi đúng đường của request thật: với FAST_INGEST ảnh được letterbox vào canvas imgsz x imgsz và gửi kèm imgsz,
+    # mỗi imgsz có thể dùng (các mức của ADAPTIVE_IMGSZ) đều được chạy thử vì model khởi tạo lại khi đổi kích thước
+    width, height = WARMUP_SIZE
+    dummy = np.zeros((height, width, 3), dtype=np.uint8)
+    if worker_pool is not None and not worker_pool.wait_ready(WORKER_TIMEOUT * 10):
+        raise TimeoutError("Worker nhận diện chưa nạp xong model")
+    for _ in range(WARMUP_RUNS):
+        for imgsz in (resolution.sizes if ADAPTIVE_IMGSZ else [None]):
+            image = dummy
+            if FAST_INGEST:
+                imgsz = imgsz or INFERENCE_IMGSZ
+                image, _, _ = letterbox(dummy, imgsz)
+            if worker_pool is not None:
+                # Mỗi worker nhận đúng một frame
+                worker_pool.warm_up(image, imgsz, timeout=WORKER_TIMEOUT * 10)
+            else:
+                batcher.predict(image, imgsz)
+                wait_results(batcher.submit_many([image] * BATCH_MAX_SIZE, imgsz), None)
+
+def load_model_in_background():
+    try:
+        ensure_model()
+    except ModelUnavailable as e:
+        print(e)
+
+def wait_results(futures, deadline, default_timeout=None): # Chờ các Future; hết deadline thì hủy phần còn lại và báo DeadlineExceeded
+    try:
+        return [future.result(timeout=remaining(deadline, default_timeout)) for future in futures]
+    except FutureTimeout:
+        cancel_on_timeout(futures, deadline)
+
+def cancel_on_timeout(futures, deadline): # Hủy các Future còn chờ rồi báo DeadlineExceeded (quá deadline) hoặc FutureTimeout
+    for future in futures:
+        future.cancel()
+    if deadline is not None and remaining(deadline) == 0:
+        raise DeadlineExceeded("Đã quá thời hạn xử lý request")
+    raise FutureTimeout()
+
+def pool_results(images, imgsz=None, deadline=None): # Nhận diện qua worker pool; thời gian chờ slot trống cũng tính vào deadline / WORKER_TIMEOUT
+    futures = []
+    try:
+        for image in images:
+            futures.append(worker_pool.submit(image, imgsz, timeout=remaining(deadline, WORKER_TIMEOUT)))
+    except FutureTimeout:
+        cancel_on_timeout(futures, deadline)
+    return wait_results(futures, deadline, WORKER_TIMEOUT)
+
+def detect_one(image, imgsz=None, deadline=None): # Nhận diện một ảnh (chưa lọc), qua worker pool hoặc BatchScheduler
+    ensure_model()
+    if worker_pool is not None:
+        return pool_results([image], imgsz, deadline)[0]
+    return extract_detections(wait_results([batcher.submit(image, imgsz, deadline)], deadline)[0])
+
+def detect_regions(image, rois, imgsz=None, deadline=None): # Nhận diện trên từng vùng (ROI), trả về detections theo tọa độ ảnh gốc
+    ensure_model()
+    crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in rois]
+    if worker_pool is not None:
+        results = pool_results(crops, imgsz, deadline)
+    else:
+        # Gửi mọi vùng trước rồi mới chờ, để BatchScheduler gom chúng vào cùng một batch
+        futures = [batcher.submit(crop, imgsz, deadline) for crop in crops]
+        results = [extract_detections(result) for result in wait_results(futures, deadline)]
+    detections = []
+    for (x1, y1, _, _), region_detections in zip(rois, results):
+        for d in region_detections:
+            bx1, by1, bx2, by2 = d["box"]
+            detections.append(dict(d, box=[bx1 + x1, by1 + y1, bx2 + x1, by2 + y1]))
+    return detections
+
+def detect_many(images, imgsz=None, deadline=None): # Nhận diện một batch ảnh (chưa lọc), trả về danh sách detections cho từng ảnh
+    ensure_model()
+    if worker_pool is not None:
+        return pool_results(images, imgsz, deadline)
+    # Qua BatchScheduler như request đơn lẻ: model chỉ được gọi từ thread của scheduler
+    return [extract_detections(result) for result in wait_results(batcher.submit_many(images, imgsz, deadline), deadline)]
+
+# imgsz client được phép yêu cầu (làm tròn lên bội số 32)
+IMGSZ_MIN = int(os.environ.get("IMGSZ_MIN", 160))
+IMGSZ_MAX = int(os.environ.get("IMGSZ_MAX", 1280))
+# ADAPTIVE_IMGSZ=1: giảm imgsz khi có nhiều request đang chờ, tăng lại khi server rảnh
+ADAPTIVE_IMGSZ = os.environ.get("ADAPTIVE_IMGSZ", "0") == "1"
+ADAPTIVE_IMGSZ_SIZES = [int(v) for v in os.environ.get("ADAPTIVE_IMGSZ_SIZES", f"320,480,{INFERENCE_IMGSZ}").split(",")]
+ADAPTIVE_LOW_DEPTH = int(os.environ.get("ADAPTIVE_LOW_DEPTH", 2))
+ADAPTIVE_HIGH_DEPTH = int(os.environ.get("ADAPTIVE_HIGH_DEPTH", 8))
+resolution = AdaptiveResolution(ADAPTIVE_IMGSZ_SIZES, low_depth=ADAPTIVE_LOW_DEPTH, high_depth=ADAPTIVE_HIGH_DEPTH,
+                                enabled=ADAPTIVE_IMGSZ)
+# Số vùng ROI tối đa mỗi request
+MAX_ROIS = int(os.environ.get("MAX_ROIS", 8))
+# FAST_INGEST=1: giải mã JPEG ở độ phân giải giảm khi không cần trả ảnh, letterbox vào buffer có sẵn trước khi gọi model
+FAST_INGEST = os.environ.get("FAST_INGEST", "1") == "1"
+
+# Sau các cấu hình warm_up() cần dùng (imgsz thích ứng, FAST_INGEST)
+if MODEL_LOADING == "background" and SERVING_PROCESS:
+    threading.Thread(target=load_model_in_background, name="model-loader", daemon=True).start()
+
+# Cấu hình mặc định cho chế độ stream toàn bộ video
+VIDEO_FRAME_STRIDE = int(os.environ.get("VIDEO_FRAME_STRIDE", 1))
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", 8))
+
+# /detect/batch/: số ảnh mỗi lần gọi model, số thread giải mã, giới hạn số file và tổng dung lượng (MB) mỗi request
+DETECT_BATCH_SIZE = int(os.environ.get("DETECT_BATCH_SIZE", 16))
+BATCH_DECODE_THREADS = int(os.environ.get("BATCH_DECODE_THREADS", os.cpu_count() or 4))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 1000))
+BATCH_MAX_TOTAL_MB = int(os.environ.get("BATCH_MAX_TOTAL_MB", 512))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+decode_executor = ThreadPoolExecutor(max_workers=BATCH_DECODE_THREADS, thread_name_prefix="batch-decode")
 
 STATIC_DIR = "static_img"
 os.makedirs(STATIC_DIR, exist_ok=True)
 
+# Kết quả nhận diện gần đây (bytes ảnh upload + detections), cho phép /capture/ lưu theo result_id
+RECENT_RESULTS_MAX = int(os.environ.get("RECENT_RESULTS_MAX", 64))
+RECENT_RESULTS_TTL = float(os.environ.get("RECENT_RESULTS_TTL", 300))
+recent_results = LRUCache(max_items=RECENT_RESULTS_MAX, ttl=RECENT_RESULTS_TTL)
+
+# Cache kết quả nhận diện theo nội dung ảnh (frame trùng lặp không cần chạy lại model)
+# RESULT_CACHE_PERCEPTUAL=1: dùng dHash để gộp cả các frame gần giống nhau
+RESULT_CACHE_MAX = int(os.environ.get("RESULT_CACHE_MAX", 1024))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 60))
+RESULT_CACHE_PERCEPTUAL = os.environ.get("RESULT_CACHE_PERCEPTUAL", "0") == "1"
+result_cache = DetectionResultCache(max_items=RESULT_CACHE_MAX, ttl=RESULT_CACHE_TTL, perceptual=RESULT_CACHE_PERCEPTUAL)
+
+# Số ảnh mặc định / tối đa mỗi trang của /images/
+IMAGES_PAGE_SIZE = 100
+IMAGES_MAX_PAGE_SIZE = 1000
+
+# Tạo bảng / chỉ mục còn thiếu và chuyển detections JSON cũ sang bảng detections
+init_db()
+
+# Pool kết nối SQLite (WAL, synchronous=NORMAL, mmap); conn.close() trả kết nối về pool
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+db_pool = SQLitePool(DB_PATH, max_idle=DB_POOL_SIZE, mmap_size=DB_MMAP_SIZE,
+                     observer=lambda operation, seconds: db_query_seconds.observe(seconds, operation))
+
 def get_db_connection():
-    conn = sqlite3.connect("data_images.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.acquire()
+
+def parse_filter_params(conf, classes): # conf (độ tin cậy tối thiểu), classes (danh sách nhãn, cách nhau bởi dấu phẩy)
+    try:
+        min_confidence = float(conf) if conf not in (None, "") else None
+    except ValueError:
+        min_confidence = None
+    labels = [label.strip() for label in classes.split(",") if label.strip()] if classes else None
+    return min_confidence, labels
+
+def get_filter_params(): # Đọc tham số lọc từ query string hoặc form của request Flask
+    return parse_filter_params(request.args.get("conf", request.form.get("conf")),
+                               request.args.get("classes", request.form.get("classes")))
+
+def parse_inference_params(imgsz, roi): # imgsz (kích thước đầu vào model), roi ("x1,y1,x2,y2", nhiều vùng cách nhau bởi ";")
+    # Tham số sai định dạng gây ValueError, route trả về 400
+    if imgsz not in (None, ""):
+        try:
+            imgsz = int(imgsz)
+        except ValueError:
+            raise ValueError("imgsz phải là số nguyên")
+        imgsz = round_imgsz(min(max(imgsz, IMGSZ_MIN), IMGSZ_MAX))
+    else:
+        imgsz = None
+    rois = None
+    if roi:
+        rois = []
+        for part in roi.split(";"):
+            if not part.strip():
+                continue
+            try:
+                x1, y1, x2, y2 = (int(float(v)) for v in part.split(","))
+            except ValueError:
+                raise ValueError(f"roi không hợp lệ: {part}")
+            rois.append((x1, y1, x2, y2))
+        if len(rois) > MAX_ROIS:
+            raise ValueError(f"Tối đa {MAX_ROIS} vùng roi mỗi request")
+    return imgsz, rois or None
+
+def get_inference_params(): # Đọc imgsz / roi từ query string hoặc form của request Flask
+    return parse_inference_params(request.args.get("imgsz", request.form.get("imgsz")),
+                                  request.args.get("roi", request.form.get("roi")))
+
+def clip_rois(rois, width, height): # Cắt các vùng ROI theo kích thước ảnh, bỏ vùng rỗng
+    clipped = []
+    for x1, y1, x2, y2 in rois:
+        x1, x2 = sorted((min(max(x1, 0), width), min(max(x2, 0), width)))
+        y1, y2 = sorted((min(max(y1, 0), height), min(max(y2, 0), height)))
+        if x2 - x1 > 1 and y2 - y1 > 1:
+            clipped.append((x1, y1, x2, y2))
+    return clipped
+
+def to_flask_response(status, mimetype, body): # Đổi kết quả (status, mimetype, body) thành response Flask
+    if isinstance(body, dict):
+        return jsonify(body), status
+    return Response(body, status=status, mimetype=mimetype)
 
 @app.route("/detect/image/", methods=["POST"])
 def detect_image():
@@ -32,31 +347,138 @@ def detect_image():
         file = request.files["file"]
         if file.filename == "":
             return jsonify({"error": "File rỗng"}), 400
-        image = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
+        with stage("read"):
+            image_bytes = file.read()
+
+        min_confidence, labels = get_filter_params()
+        try:
+            imgsz, rois = get_inference_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # format: json (mặc định, ảnh base64), detections, multipart, msgpack
+        response_format = request.args.get("format", request.form.get("format", "json"))
+        status, mimetype, body = process_image_bytes(image_bytes, response_format, min_confidence, labels, imgsz, rois,
+                                                     g.get("deadline"))
+        with stage("serialize"):
+            return to_flask_response(status, mimetype, body)
+
+    except DeadlineExceeded as e:
+        deadline_exceeded.inc("/detect/image/")
+        return overloaded_response(503, str(e), ADMISSION_RETRY_AFTER)
+    except ModelUnavailable as e:
+        detect_errors.inc("/detect/image/", "model_unavailable")
+        return jsonify({"error": str(e)}), 503
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        detect_errors.inc("/detect/image/", type(e).__name__)
+        return jsonify({"error": str(e)}), 500
+
+def process_image_bytes(image_bytes, response_format="json", min_confidence=None, labels=None, imgsz=None, rois=None,
+                        deadline=None):
+    # Giải mã, nhận diện và tạo nội dung response; dùng chung cho Flask và ASGI (asgi_app.py)
+    # Trả về (status, mimetype, body), body là dict (JSON) hoặc bytes; DeadlineExceeded nếu client đã hết thời gian chờ
+    check_deadline(deadline)
+    imgsz = resolution.acquire(imgsz)
+    try:
+        target_size = imgsz or INFERENCE_IMGSZ
+        # Các định dạng trả về ảnh đã vẽ (json, multipart) và chế độ ROI cần ảnh ở độ phân giải gốc
+        reduced = FAST_INGEST and not rois and response_format in ("detections", "msgpack")
+        with stage("decode"):
+            image, scale = decode_image(image_bytes, target_size if reduced else None)
         if image is None:
-            return jsonify({"error": "Không thể đọc file ảnh"}), 400
-
-        results = model(image)
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                label = r.names[int(box.cls)]
-                confidence = float(box.conf)
-                cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(image, f"{label} {confidence:.2f}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 0, 255), 2)
-                detections.append({"label": label, "confidence": confidence, "box": [x1, y1, x2, y2]})
+            return 400, None, {"error": "Không thể đọc file ảnh"}
+        if rois:
+            rois = clip_rois(rois, image.shape[1], image.shape[0])
+            if not rois:
+                return 400, None, {"error": "roi nằm ngoài ảnh"}
 
-        _, buffer = cv2.imencode(".jpg", image)
-        image_base64 = base64.b64encode(buffer).decode("utf-8")
-        return jsonify({
-            "image_data": image_base64,
+        # Cache lưu kết quả chưa lọc, bộ lọc conf/classes áp dụng sau; imgsz và roi làm kết quả khác nhau nên nằm trong khóa
+        with stage("cache_lookup"):
+            cache_key = result_cache.key(image, extra=f"{imgsz}|{rois}")
+            detections = result_cache.get(cache_key)
+        if detections is None:
+            check_deadline(deadline)
+            if rois:
+                with stage("inference"):
+                    detections = detect_regions(image, rois, imgsz, deadline)
+            elif FAST_INGEST:
+                # Model nhận đúng kích thước đầu vào, ultralytics không phải resize / copy thêm lần nữa
+                with stage("letterbox"):
+                    canvas, ratio, pad = letterbox(image, target_size)
+                with stage("inference"):
+                    detections = detect_one(canvas, target_size, deadline)
+                detections = unletterbox(detections, ratio, pad, scale, image.shape[1] * scale, image.shape[0] * scale)
+            else:
+                with stage("inference"):
+                    detections = detect_one(image, imgsz, deadline)
+            result_cache.put(cache_key, detections)
+    finally:
+        resolution.release()
+    detections = filter_detections(detections, min_confidence, labels)
+
+    # Giữ ảnh gốc trong thời gian ngắn để client lưu lại bằng result_id mà không phải gửi lại ảnh
+    result_id = uuid.uuid4().hex
+    recent_results.put(result_id, (image_bytes, detections))
+
+    return build_image_response(image, detections, response_format, result_id)
+
+def draw_detections(image, detections, font_scale=0.75): # Vẽ khung và nhãn lên ảnh
+    for detection in detections:
+        x1, y1, x2, y2 = detection["box"]
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(image, f"{detection['label']} {detection['confidence']:.2f}", (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 255), 2)
+    return image
+
+def build_image_response(image, detections, response_format, result_id=None): # Tạo nội dung response theo định dạng client yêu cầu
+    if response_format == "detections":
+        # Chỉ trả kết quả, không vẽ và không mã hóa lại ảnh
+        return 200, "application/json", {
+            "result_id": result_id,
             "detections": detections,
             "message": "Nhận diện thành công"
-        }), 200 
+        }
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    if response_format == "msgpack":
+        if msgpack is None:
+            return 400, None, {"error": "Server chưa cài msgpack"}
+        # boxes: mảng float32 (N x 4), confidences: mảng float32 (N)
+        body = msgpack.packb({
+            "result_id": result_id,
+            "count": len(detections),
+            "labels": [d["label"] for d in detections],
+            "confidences": np.asarray([d["confidence"] for d in detections], dtype=np.float32).tobytes(),
+            "boxes": np.asarray([d["box"] for d in detections], dtype=np.float32).reshape(-1, 4).tobytes(),
+        }, use_bin_type=True)
+        return 200, "application/msgpack", body
+
+    with stage("draw"):
+        draw_detections(image, detections)
+    with stage("encode"):
+        _, buffer = cv2.imencode(".jpg", image)
+
+    if response_format == "multipart":
+        # Phần 1: JSON kết quả, phần 2: ảnh JPEG thô (không base64)
+        boundary = uuid.uuid4().hex
+        body = b"".join([
+            f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+            json.dumps({"result_id": result_id, "detections": detections, "message": "Nhận diện thành công"}).encode(),
+            f"\r\n--{boundary}\r\nContent-Type: image/jpeg\r\n"
+            f"Content-Disposition: inline; filename=\"result.jpg\"\r\n\r\n".encode(),
+            buffer.tobytes(),
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+        return 200, f"multipart/mixed; boundary={boundary}", body
+
+    with stage("base64"):
+        image_base64 = base64.b64encode(buffer).decode("utf-8")
+    return 200, "application/json", {
+        "result_id": result_id,
+        "image_data": image_base64,
+        "detections": detections,
+        "message": "Nhận diện thành công"
+    }
 
 @app.route("/detect/video/", methods=["POST"])
 def detect_video():
@@ -76,23 +498,32 @@ def detect_video():
             os.remove(temp_video_path)
             return jsonify({"error": "Không thể mở file video"}), 400
 
+        # mode=stream: xử lý toàn bộ video và trả kết quả từng frame dạng NDJSON
+        if request.args.get("mode", request.form.get("mode")) == "stream":
+            stride = max(1, request.args.get("stride", VIDEO_FRAME_STRIDE, type=int))
+            batch_size = max(1, request.args.get("batch_size", VIDEO_BATCH_SIZE, type=int))
+            min_confidence, labels = get_filter_params()
+            try:
+                imgsz, _ = get_inference_params()
+            except ValueError as e:
+                cap.release()
+                os.remove(temp_video_path)
+                return jsonify({"error": str(e)}), 400
+            lines = stream_video_detections(cap, temp_video_path, stride, batch_size, min_confidence, labels, imgsz)
+            if g.get("admission_client") is not None:
+                # Giữ suất admission tới khi stream xong, không trả lại ở teardown
+                lines = release_when_done(lines, g.pop("admission_client"))
+            return Response(lines, mimetype="application/x-ndjson")
+
         ret, frame = cap.read()
         if not ret:
             cap.release()
             os.remove(temp_video_path)
             return jsonify({"error": "Không thể đọc frame từ video"}), 400
 
-        results = model(frame)
-        detections = []
-        for r in results:
-            for box in r.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                label = r.names[int(box.cls)]
-                confidence = float(box.conf)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(frame, f"{label} {confidence:.2f}",
-                            (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-                detections.append({"label": label, "confidence": confidence, "box": [x1, y1, x2, y2]})
+        min_confidence, labels = get_filter_params()
+        detections = filter_detections(detect_one(frame, deadline=g.get("deadline")), min_confidence, labels)
+        draw_detections(frame, detections, font_scale=0.5)
 
         _, buffer = cv2.imencode(".jpg", frame)
         image_base64 = base64.b64encode(buffer).decode("utf-8")
@@ -106,6 +537,379 @@ def detect_video():
             "message": "Nhận diện frame đầu tiên thành công"
         }), 200
 
+    except DeadlineExceeded as e:
+        deadline_exceeded.inc("/detect/video/")
+        return overloaded_response(503, str(e), ADMISSION_RETRY_AFTER)
+    except ModelUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def detect_frames(frame_indices, frames, min_confidence=None, labels=None, imgsz=None): # Chạy model trên một batch frame, trả về từng dòng NDJSON
+    lines = []
+    with stage("inference"):
+        batch_detections = detect_many(frames, imgsz)
+    for frame_index, detections in zip(frame_indices, batch_detections):
+        detections = filter_detections(detections, min_confidence, labels)
+        lines.append(json.dumps({"frame": frame_index, "detections": detections}) + "\n")
+    return lines
+
+def stream_video_detections(cap, temp_video_path, stride, batch_size, min_confidence=None, labels=None, imgsz=None): # Đọc video, gom batch frame và stream kết quả
+    # temp_video_path: file tạm của request, xóa khi stream xong; None khi file thuộc về nơi khác (đầu vào của job)
+    try:
+        frame_index = 0
+        frame_indices, frames = [], []
+        while True:
+            # Các frame bị bỏ qua theo stride chỉ grab(), không cần giải mã
+            if frame_index % stride != 0:
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_indices.append(frame_index)
+            frames.append(frame)
+            if len(frames) >= batch_size:
+                yield from detect_frames(frame_indices, frames, min_confidence, labels, imgsz)
+                frame_indices, frames = [], []
+            frame_index += 1
+
+        if frames:
+            yield from detect_frames(frame_indices, frames, min_confidence, labels, imgsz)
+        yield json.dumps({"done": True, "total_frames": frame_index, "message": "Nhận diện toàn bộ video thành công"}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+    finally:
+        cap.release()
+        if temp_video_path is not None and os.path.exists(temp_video_path):
+            os.remove(temp_video_path)
+
+@app.route("/detect/batch/", methods=["POST"])
+def detect_batch():
+    # Nhận nhiều ảnh trong một request: nhiều trường "files" (multipart) hoặc một file nén .zip / .tar(.gz) ở trường "archive"
+    try:
+        try:
+            items = read_batch_items()
+            imgsz, _ = get_inference_params()
+        except BatchTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not items:
+            return jsonify({"error": "Không tìm thấy ảnh trong request"}), 400
+
+        min_confidence, labels = get_filter_params()
+        # format=detections: chỉ trả kết quả, không vẽ và mã hóa lại ảnh (cho phép giải mã ở độ phân giải giảm)
+        detections_only = request.args.get("format", request.form.get("format", "json")) == "detections"
+        results = detect_batch_items(items, imgsz or INFERENCE_IMGSZ, detections_only, min_confidence, labels,
+                                     g.get("deadline"))
+        return jsonify({
+            "results": results,
+            "count": len(results),
+            "message": "Nhận diện hàng loạt thành công"
+        }), 200
+
+    except DeadlineExceeded as e:
+        deadline_exceeded.inc("/detect/batch/")
+        return overloaded_response(503, str(e), ADMISSION_RETRY_AFTER)
+    except ModelUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+class BatchTooLarge(ValueError):
+    # Vượt BATCH_MAX_FILES / BATCH_MAX_TOTAL_MB, trả 413
+    pass
+
+class BatchReader:
+    # Đọc ảnh của một request /detect/batch/, đếm số file và tổng dung lượng trước mỗi lần read()
+    def __init__(self):
+        self.items = []
+        self.total = 0
+
+    def reserve(self, size): # Kiểm tra giới hạn trước khi đọc thêm một file size bytes
+        if len(self.items) + 1 > BATCH_MAX_FILES:
+            raise BatchTooLarge(f"Tối đa {BATCH_MAX_FILES} ảnh mỗi request")
+        if self.total + size > BATCH_MAX_TOTAL_MB * 1024 * 1024:
+            raise BatchTooLarge(f"Tổng dung lượng ảnh vượt quá {BATCH_MAX_TOTAL_MB} MB")
+        self.total += size
+
+    def read(self, name, stream, size): # Đọc tối đa size bytes; file lớn hơn kích thước khai báo (zip bomb) bị từ chối
+        self.reserve(size)
+        data = stream.read(size + 1)
+        if len(data) > size:
+            raise BatchTooLarge(f"{name}: dung lượng thực tế lớn hơn kích thước khai báo")
+        self.items.append((name, data))
+
+def read_batch_items(): # Đọc danh sách (tên file, bytes) từ request; BatchTooLarge / ValueError nếu vượt giới hạn
+    reader = BatchReader()
+    for file in request.files.getlist("files") + request.files.getlist("file"):
+        if file.filename:
+            # File upload đã được Werkzeug ghi tạm ra đĩa: lấy kích thước trước khi đọc vào bộ nhớ
+            file.stream.seek(0, os.SEEK_END)
+            size = file.stream.tell()
+            file.stream.seek(0)
+            reader.read(file.filename, file.stream, size)
+    archive = request.files.get("archive")
+    if archive is not None and archive.filename:
+        read_archive(archive.stream, reader)
+    return reader.items
+
+def read_archive(stream, reader): # Lấy các file ảnh trong file nén zip / tar, kiểm tra số file và dung lượng trước mỗi lần giải nén
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    with archive.open(info) as member:
+                        reader.read(info.filename, member, info.file_size)
+        return
+    stream.seek(0)
+    try:
+        with tarfile.open(fileobj=stream, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    reader.read(member.name, archive.extractfile(member), member.size)
+    except tarfile.TarError:
+        raise ValueError("archive phải là file .zip hoặc .tar")
+
+def decode_batch_item(image_bytes, target_size): # Chạy trong decode_executor
+    try:
+        with stage("decode"):
+            return decode_image(image_bytes, target_size)
+    except Exception:
+        return None, 1
+
+def detect_batch_items(items, target_size, detections_only, min_confidence=None, labels=None, deadline=None):
+    # Giải mã song song trong thread pool, giải mã nhóm tiếp theo trong lúc model chạy nhóm hiện tại
+    # Quá deadline thì dừng trước nhóm tiếp theo (DeadlineExceeded)
+    reduce_to = target_size if FAST_INGEST and detections_only else None
+    chunks = [items[i:i + DETECT_BATCH_SIZE] for i in range(0, len(items), DETECT_BATCH_SIZE)]
+    results = []
+    pending = [decode_executor.submit(decode_batch_item, data, reduce_to) for _, data in chunks[0]] if chunks else []
+    try:
+        for index, chunk in enumerate(chunks):
+            decoded = [future.result(timeout=remaining(deadline)) for future in pending]
+            check_deadline(deadline)
+            if index + 1 < len(chunks):
+                pending = [decode_executor.submit(decode_batch_item, data, reduce_to) for _, data in chunks[index + 1]]
+            results.extend(detect_batch_chunk(chunk, decoded, target_size, detections_only, min_confidence, labels, deadline))
+    except FutureTimeout:
+        # Hết deadline khi đang chờ giải mã: bỏ các nhóm đang giải mã dở
+        cancel_on_timeout(pending, deadline)
+    except DeadlineExceeded:
+        for future in pending:
+            future.cancel()
+        raise
+    return results
+
+def detect_batch_chunk(chunk, decoded, target_size, detections_only, min_confidence=None, labels=None, deadline=None):
+    valid = [i for i, (image, _) in enumerate(decoded) if image is not None]
+    # Cả nhóm được letterbox vào một mảng liên tục (N x imgsz x imgsz x 3)
+    inputs = np.empty((len(valid), target_size, target_size, 3), dtype=np.uint8)
+    boxes = {}
+    for row, i in enumerate(valid):
+        _, ratio, pad = letterbox(decoded[i][0], target_size, out=inputs[row])
+        boxes[i] = (ratio, pad)
+    batch_detections = {}
+    if valid:
+        with stage("inference"):
+            batch_detections = dict(zip(valid, detect_many(list(inputs), target_size, deadline)))
+
+    results = []
+    for i, (filename, _) in enumerate(chunk):
+        image, scale = decoded[i]
+        if image is None:
+            results.append({"file": filename, "error": "Không thể đọc file ảnh"})
+            continue
+        ratio, pad = boxes[i]
+        detections = unletterbox(batch_detections[i], ratio, pad, scale, image.shape[1] * scale, image.shape[0] * scale)
+        detections = filter_detections(detections, min_confidence, labels)
+        entry = {"file": filename, "detections": detections}
+        if not detections_only:
+            with stage("draw"):
+                draw_detections(image, detections)
+            with stage("encode"):
+                _, buffer = cv2.imencode(".jpg", image)
+            entry["image_data"] = base64.b64encode(buffer).decode("utf-8")
+        results.append(entry)
+    return results
+
+# Job nền cho video / batch dài: client gửi job, theo dõi tiến độ, lấy kết quả sau
+JOB_DIR = os.environ.get("JOB_DIR", "jobs")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+# Job nhường model cho request /detect/image/ đang chờ, tối đa JOB_MAX_YIELD_MS trước mỗi batch
+JOB_MAX_YIELD_MS = float(os.environ.get("JOB_MAX_YIELD_MS", 200))
+# Số job chờ tối đa, vượt quá thì từ chối job mới (503 + Retry-After)
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", 100))
+JOB_RETRY_AFTER = int(os.environ.get("JOB_RETRY_AFTER", 30))
+
+def yield_to_interactive(): # Chờ các request nhận diện tương tác xử lý xong (có giới hạn thời gian)
+    deadline = time.monotonic() + JOB_MAX_YIELD_MS / 1000.0
+    while resolution.in_flight > 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+def run_video_job(job, context): # Nhận diện toàn bộ video, ghi kết quả NDJSON (giống mode=stream của /detect/video/)
+    params = job["params"]
+    cap = cv2.VideoCapture(job["input_path"])
+    if not cap.isOpened():
+        cap.release()
+        raise ValueError("Không thể mở file video")
+    stride = params.get("stride", VIDEO_FRAME_STRIDE)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    context.update(0, total, force=True)
+    min_confidence, labels = parse_filter_params(params.get("conf"), params.get("classes"))
+    lines = stream_video_detections(cap, None, stride, params.get("batch_size", VIDEO_BATCH_SIZE),
+                                    min_confidence, labels, params.get("imgsz"))
+    result_path = context.result_path(".ndjson")
+    try:
+        with open(result_path, "w", encoding="utf-8") as out:
+            while True:
+                yield_to_interactive()
+                line = next(lines, None)
+                if line is None:
+                    break
+                out.write(line)
+                item = json.loads(line)
+                if "error" in item:
+                    raise RuntimeError(item["error"])
+                if "frame" in item:
+                    context.update(item["frame"] + 1, total)
+    finally:
+        lines.close()
+    return result_path
+
+def run_batch_job(job, context): # Nhận diện các ảnh đã lưu trong thư mục đầu vào, ghi kết quả JSON
+    params = job["params"]
+    filenames = params["files"]
+    target_size = params.get("imgsz") or INFERENCE_IMGSZ
+    detections_only = params.get("format") == "detections"
+    min_confidence, labels = parse_filter_params(params.get("conf"), params.get("classes"))
+    context.update(0, len(filenames), force=True)
+    results = []
+    for start in range(0, len(filenames), DETECT_BATCH_SIZE):
+        items = []
+        for index in range(start, min(start + DETECT_BATCH_SIZE, len(filenames))):
+            with open(os.path.join(job["input_path"], f"{index:06d}"), "rb") as f:
+                items.append((filenames[index], f.read()))
+        yield_to_interactive()
+        results.extend(detect_batch_items(items, target_size, detections_only, min_confidence, labels))
+        context.update(len(results), len(filenames))
+    result_path = context.result_path(".json")
+    with open(result_path, "w", encoding="utf-8") as out:
+        json.dump({"results": results, "count": len(results)}, out)
+    return result_path
+
+job_queue = JobQueue(db_pool, JOB_DIR, {"video": run_video_job, "batch": run_batch_job}, num_workers=JOB_WORKERS)
+# Replica không nạp model (MODEL_LOADING=off) không chạy job
+if MODEL_LOADING != "off" and SERVING_PROCESS:
+    job_queue.start()
+
+@app.route("/jobs/", methods=["POST"])
+def submit_job():
+    # kind=video: trường "file" là video; kind=batch: nhiều trường "files" hoặc "archive" (như /detect/batch/)
+    try:
+        if JOB_MAX_QUEUED and job_queue.count("queued") >= JOB_MAX_QUEUED:
+            admission_rejected.inc(503)
+            return overloaded_response(503, "Hàng đợi job đã đầy, vui lòng thử lại sau", JOB_RETRY_AFTER)
+        kind = request.args.get("kind", request.form.get("kind", "video"))
+        try:
+            imgsz, _ = get_inference_params()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        params = {
+            "imgsz": imgsz,
+            "conf": request.args.get("conf", request.form.get("conf")),
+            "classes": request.args.get("classes", request.form.get("classes")),
+        }
+        job_id = uuid.uuid4().hex
+
+        if kind == "video":
+            file = request.files.get("file")
+            if file is None or file.filename == "":
+                return jsonify({"error": "Không tìm thấy file trong request"}), 400
+            params["stride"] = max(1, request.args.get("stride", VIDEO_FRAME_STRIDE, type=int))
+            params["batch_size"] = max(1, request.args.get("batch_size", VIDEO_BATCH_SIZE, type=int))
+            # Ghi thẳng ra đĩa, không giữ cả video trong bộ nhớ
+            input_path = os.path.join(JOB_DIR, f"{job_id}.input{os.path.splitext(file.filename)[1] or '.mp4'}")
+            file.save(input_path)
+        elif kind == "batch":
+            try:
+                items = read_batch_items()
+            except BatchTooLarge as e:
+                return jsonify({"error": str(e)}), 413
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if not items:
+                return jsonify({"error": "Không tìm thấy ảnh trong request"}), 400
+            params["format"] = request.args.get("format", request.form.get("format", "json"))
+            params["files"] = [filename for filename, _ in items]
+            input_path = os.path.join(JOB_DIR, f"{job_id}.input")
+            os.makedirs(input_path)
+            for index, (_, data) in enumerate(items):
+                with open(os.path.join(input_path, f"{index:06d}"), "wb") as f:
+                    f.write(data)
+        else:
+            return jsonify({"error": f"Loại job không hợp lệ: {kind}"}), 400
+
+        job_queue.submit(job_id, kind, params, input_path)
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "message": "Đã nhận job"
+        }), 202
+
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/", methods=["GET"])
+def list_jobs():
+    try:
+        limit = min(max(1, request.args.get("limit", 100, type=int)), IMAGES_MAX_PAGE_SIZE)
+        return jsonify({"jobs": job_queue.list(request.args.get("status"), limit)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Không tìm thấy job"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    try:
+        job = job_queue.cancel(job_id)
+        if job is None:
+            return jsonify({"error": "Không tìm thấy job"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Không tìm thấy job"}), 404
+        result_path = job_queue.result_path(job_id)
+        if result_path is None or not os.path.exists(result_path):
+            return jsonify({"error": f"Job chưa có kết quả (trạng thái: {job['status']})", "job": job}), 409
+        mimetype = "application/x-ndjson" if result_path.endswith(".ndjson") else "application/json"
+        return send_file(result_path, mimetype=mimetype)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -118,12 +922,20 @@ def save_image():
 
         if not file_path or not detections:
             return jsonify({"error": "Thiếu file_path hoặc detections"}), 400
+        # detections có thể là chuỗi JSON (như App_tk gửi) hoặc danh sách
+        try:
+            detection_list = json.loads(detections) if isinstance(detections, str) else detections
+            detections_json = detections if isinstance(detections, str) else json.dumps(detections)
+        except ValueError:
+            return jsonify({"error": "detections không phải JSON hợp lệ"}), 400
+
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("INSERT INTO images (file_path, detections) VALUES (?, ?)",
-                       (file_path, detections))
-        conn.commit()
+                       (file_path, detections_json))
         image_id = cursor.lastrowid
+        insert_detections(cursor, image_id, detection_list)
+        conn.commit()
         conn.close()
 
         return jsonify({
@@ -134,32 +946,300 @@ def save_image():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def store_capture(image_bytes, extension, detections): # Ghi file ảnh (tên theo nội dung) và thêm bản ghi trong cùng transaction
+    # Ảnh giống hệt nhau có cùng tên file, nên chỉ được lưu một lần (index UNIQUE trên file_path của ảnh chụp)
+    file_path = os.path.join(STATIC_DIR, f"captured_{hashlib.sha256(image_bytes).hexdigest()[:32]}{extension}")
+    conn = get_db_connection()
+    created = False
+    try:
+        cursor = conn.cursor()
+        # INSERT giữ khóa ghi tới khi commit: upload cùng nội dung chạy đồng thời chờ rồi bị bỏ qua (rowcount = 0)
+        cursor.execute("INSERT OR IGNORE INTO images (file_path, detections) VALUES (?, ?)",
+                       (file_path, json.dumps(detections)))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            row = cursor.execute("SELECT id FROM images WHERE file_path = ?", (file_path,)).fetchone()
+            return row["id"], file_path, False
+        image_id = cursor.lastrowid
+        try:
+            insert_detections(cursor, image_id, detections)
+            if not os.path.exists(file_path):
+                temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(image_bytes)
+                os.replace(temp_path, file_path)
+                created = True
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if created:
+                os.remove(file_path)
+            raise
+        return image_id, file_path, True
+    finally:
+        conn.close()
+
+def image_extension(image_bytes): # Đoán phần mở rộng từ chữ ký file, None nếu không phải JPEG/PNG
+    if image_bytes.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    return None
+
+# kiểm tra process còn sống (không phụ thuộc model)
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_started = time.perf_counter()
+    http_in_flight.inc(g.metrics_endpoint)
+    begin_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = g.get("metrics_endpoint", "unmatched")
+    seconds = time.perf_counter() - g.get("request_started", time.perf_counter())
+    http_requests.inc(endpoint, request.method, response.status_code)
+    http_request_seconds.observe(seconds, endpoint)
+    timings = end_timings()
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = f"{server_timing_header(timings)}, total;dur={seconds * 1000:.2f}"
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if "metrics_endpoint" in g:
+        http_in_flight.dec(g.metrics_endpoint)
+
+def overloaded_response(status, message, retry_after): # Response 429 / 503 kèm header Retry-After (giây)
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+def request_client_id(): # Client được nhận diện bằng header X-Client-Id, nếu không có thì theo địa chỉ IP
+    return request.headers.get("X-Client-Id") or request.remote_addr or "unknown"
+
+@app.before_request
+def admit_detection_request():
+    # Chỉ áp dụng cho các route nhận diện; chạy trước khi Flask đọc file upload
+    if request.endpoint not in ADMISSION_ENDPOINTS:
+        return None
+    g.deadline = parse_deadline(request.headers.get("X-Request-Deadline-Ms", request.args.get("deadline_ms")),
+                                DETECT_DEADLINE_MS)
+    client = request_client_id()
+    try:
+        admission.admit(client)
+    except AdmissionRejected as e:
+        admission_rejected.inc(e.status)
+        return overloaded_response(e.status, str(e), e.retry_after)
+    g.admission_client = client
+    return None
+
+@app.teardown_request
+def release_detection_request(error=None):
+    client = g.pop("admission_client", None)
+    if client is not None:
+        admission.release(client)
+
+def release_when_done(lines, client): # Bọc generator của response stream, trả suất admission khi stream kết thúc
+    try:
+        yield from lines
+    finally:
+        admission.release(client)
+
+def collect_runtime_metrics(): # Cập nhật các gauge lấy từ trạng thái hiện tại, gọi khi /metrics được đọc
+    if batcher is not None:
+        inference_queue_depth.set(batcher.requests.qsize())
+    elif worker_pool is not None:
+        inference_queue_depth.set(len(worker_pool.pending))
+    detect_in_flight.set(resolution.in_flight)
+    admission_in_flight.set(admission.in_flight)
+    model_ready.set(1 if model_state["status"] == "ready" else 0)
+    for name, cache in (("result_cache", result_cache.cache), ("recent_results", recent_results)):
+        stats = cache.stats()
+        cache_items.set(stats["size"], name)
+        cache_hits.set(stats["hits"], name)
+        cache_misses.set(stats["misses"], name)
+
+registry.add_collector(collect_runtime_metrics)
+
+# metrics dạng text cho Prometheus
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok"}), 200
+
+# kiểm tra sẵn sàng nhận request: 503 khi model đang nạp (chế độ background) hoặc nạp lỗi
+@app.route("/ready", methods=["GET"])
+def ready():
+    status = model_state["status"]
+    is_ready = status == "ready" or (MODEL_LOADING == "lazy" and status == "not_loaded") or status == "disabled"
+    # Worker pool: chỉ sẵn sàng khi mọi worker đã nạp model (worker chết đang được khởi động lại thì chưa)
+    pool_stats = worker_pool.stats() if worker_pool is not None else None
+    if pool_stats is not None and pool_stats["ready_workers"] < pool_stats["workers"]:
+        is_ready = False
+    return jsonify({
+        "ready": is_ready,
+        "model": dict(model_state),
+        "worker_pool": pool_stats,
+        "model_loading": MODEL_LOADING,
+        "adaptive_resolution": resolution.stats(),
+        "admission": admission.stats()
+    }), 200 if is_ready else 503
+
+# thống kê cache kết quả nhận diện
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "result_cache": result_cache.stats(),
+        "recent_results": recent_results.stats()
+    }), 200
+
+# lưu ảnh phía server: nhận bytes ảnh (multipart) hoặc result_id của một lần nhận diện gần đây
+@app.route("/capture/", methods=["POST"])
+def capture():
+    try:
+        data = request.get_json(silent=True) or {}
+        result_id = request.form.get("result_id") or data.get("result_id")
+
+        if result_id:
+            result = recent_results.get(result_id)
+            if result is None:
+                return jsonify({"error": "result_id không tồn tại hoặc đã hết hạn"}), 404
+            upload_bytes, detections = result
+            # Vẽ kết quả lên ảnh gốc rồi mã hóa JPEG một lần
+            image = cv2.imdecode(np.frombuffer(upload_bytes, np.uint8), cv2.IMREAD_COLOR)
+            _, buffer = cv2.imencode(".jpg", draw_detections(image, detections))
+            image_bytes, extension = buffer.tobytes(), ".jpg"
+        elif "file" in request.files:
+            image_bytes = request.files["file"].read()
+            extension = image_extension(image_bytes)
+            if extension is None:
+                return jsonify({"error": "Chỉ hỗ trợ ảnh JPEG hoặc PNG"}), 400
+            try:
+                detections = json.loads(request.form.get("detections") or "[]")
+            except ValueError:
+                return jsonify({"error": "detections không phải JSON hợp lệ"}), 400
+        else:
+            return jsonify({"error": "Thiếu file hoặc result_id"}), 400
+
+        image_id, file_path, created = store_capture(image_bytes, extension, detections)
+        return jsonify({
+            "image_id": image_id,
+            "file_path": file_path,
+            "message": f"Đã lưu ảnh với ID: {image_id}" if created else f"Ảnh đã tồn tại với ID: {image_id}"
+        }), 200
+
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/images/", methods=["GET"])
 def get_images():
     try:
+        # Phân trang theo khóa: trả các ảnh có id > after_id, tối đa limit ảnh
+        after_id = request.args.get("after_id", 0, type=int)
+        limit = min(max(request.args.get("limit", IMAGES_PAGE_SIZE, type=int), 1), IMAGES_MAX_PAGE_SIZE)
+        include_detections = request.args.get("include_detections", "1").lower() not in ("0", "false")
+        label = request.args.get("label")
+        min_confidence = request.args.get("min_confidence", type=float)
+
+        columns = "id, file_path, notes, detections" if include_detections else "id, file_path, notes"
+        query = f"SELECT {columns} FROM images WHERE id > ?"
+        params = [after_id]
+        # Lọc theo nhãn / độ tin cậy bằng bảng detections (có chỉ mục), không cần đọc từng dòng ra Python
+        conditions = []
+        if label:
+            conditions.append("label = ?")
+            params.append(label)
+        if min_confidence is not None:
+            conditions.append("confidence >= ?")
+            params.append(min_confidence)
+        if conditions:
+            query += " AND id IN (SELECT image_id FROM detections WHERE " + " AND ".join(conditions) + ")"
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM images")
+        cursor.execute(query, params)
         rows = cursor.fetchall()
         conn.close()
 
         # Chuyển dữ liệu thành danh sách JSON
         images = []
         for row in rows:
-            images.append({
+            image = {
                 "id": row["id"],
                 "file_path": row["file_path"],
-                "detections": json.loads(row["detections"]) if row["detections"] else [],
                 "notes": row["notes"]
-            })
+            }
+            if include_detections:
+                image["detections"] = json.loads(row["detections"]) if row["detections"] else []
+            images.append(image)
 
         return jsonify({
             "images": images,
+            # Dùng làm after_id cho trang tiếp theo, None khi đã hết dữ liệu
+            "next_after_id": images[-1]["id"] if len(images) == limit else None,
             "message": "Lấy danh sách ảnh thành công"
         }), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+# tìm detections theo nhãn / độ tin cậy (dùng bảng detections đã chuẩn hóa)
+@app.route("/detections/", methods=["GET"])
+def search_detections():
+    try:
+        after_id = request.args.get("after_id", 0, type=int)
+        limit = min(max(request.args.get("limit", IMAGES_PAGE_SIZE, type=int), 1), IMAGES_MAX_PAGE_SIZE)
+        label = request.args.get("label")
+        min_confidence = request.args.get("min_confidence", type=float)
+        image_id = request.args.get("image_id", type=int)
+
+        query = ("SELECT d.id, d.image_id, i.file_path, d.label, d.confidence, d.x1, d.y1, d.x2, d.y2 "
+                 "FROM detections d JOIN images i ON i.id = d.image_id WHERE d.id > ?")
+        params = [after_id]
+        if label:
+            query += " AND d.label = ?"
+            params.append(label)
+        if min_confidence is not None:
+            query += " AND d.confidence >= ?"
+            params.append(min_confidence)
+        if image_id is not None:
+            query += " AND d.image_id = ?"
+            params.append(image_id)
+        query += " ORDER BY d.id LIMIT ?"
+        params.append(limit)
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        conn.close()
+
+        detections = [{
+            "id": row["id"],
+            "image_id": row["image_id"],
+            "file_path": row["file_path"],
+            "label": row["label"],
+            "confidence": row["confidence"],
+            "box": [row["x1"], row["y1"], row["x2"], row["y2"]]
+        } for row in rows]
+
+        return jsonify({
+            "detections": detections,
+            "next_after_id": detections[-1]["id"] if len(detections) == limit else None,
+            "message": "Tìm kiếm detections thành công"
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # lấy ảnh theo id
 @app.route("/images/<int:id>", methods=["GET"])
 def get_image_id(id):
@@ -188,6 +1268,28 @@ def get_image_id(id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# lấy thumbnail của ảnh theo id (tạo một lần và lưu trong cache trên đĩa)
+@app.route("/images/<int:id>/thumbnail", methods=["GET"])
+def get_image_thumbnail(id):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT file_path FROM images WHERE id = ?", (id,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row:
+            return jsonify({"error": "Không tìm thấy ảnh với ID này"}), 404
+        if not os.path.exists(row["file_path"]):
+            return jsonify({"error": "Không tìm thấy file ảnh"}), 404
+
+        width = min(max(request.args.get("width", 80, type=int), 1), 640)
+        height = min(max(request.args.get("height", 60, type=int), 1), 480)
+        return send_file(get_thumbnail_path(row["file_path"], (width, height)), mimetype="image/jpeg", max_age=3600)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # xóa ảnh theo id
 @app.route("/images/<int:id>", methods=["DELETE"])
 def delete_image(id):
@@ -207,6 +1309,7 @@ def delete_image(id):
             os.remove(file_path)
 
         # Xóa bản ghi trong cơ sở dữ liệu
+        cursor.execute("DELETE FROM detections WHERE image_id = ?", (id,))
         cursor.execute("DELETE FROM images WHERE id = ?", (id,))
         conn.commit()
         conn.close()
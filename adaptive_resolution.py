@@ -0,0 +1,44 @@
+import threading
+
+
+def round_imgsz(imgsz, stride=32): # Làm tròn kích thước đầu vào lên bội số của stride model
+    return max(stride, -(-int(imgsz) // stride) * stride)
+
+
+class AdaptiveResolution:
+    # Chọn kích thước đầu vào (imgsz) theo số request nhận diện đang chờ
+    # Hàng đợi dài (>= high_depth): giảm một bậc; server rảnh (<= low_depth): tăng một bậc
+    def __init__(self, sizes, low_depth=2, high_depth=8, enabled=True):
+        self.sizes = sorted({round_imgsz(size) for size in sizes})
+        self.low_depth = low_depth
+        self.high_depth = high_depth
+        self.enabled = enabled
+        self.level = len(self.sizes) - 1
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, requested=None): # Gọi khi bắt đầu một request, trả về imgsz sẽ dùng (None = mặc định của model)
+        with self.lock:
+            self.in_flight += 1
+            if not self.enabled:
+                return requested
+            if self.in_flight >= self.high_depth and self.level > 0:
+                self.level -= 1
+            elif self.in_flight <= self.low_depth and self.level < len(self.sizes) - 1:
+                self.level += 1
+            imgsz = self.sizes[self.level]
+        # Kích thước client yêu cầu là giới hạn trên, khi quá tải vẫn có thể bị giảm thêm
+        return imgsz if requested is None else min(requested, imgsz)
+
+    def release(self): # Gọi khi request kết thúc (kể cả khi lỗi)
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "current_imgsz": self.sizes[self.level] if self.enabled else None,
+                "in_flight": self.in_flight,
+                "sizes": self.sizes,
+            }
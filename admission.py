@@ -0,0 +1,78 @@
+import time
+import threading
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class AdmissionRejected(Exception):
+    # status: 503 khi server đã đủ tải, 429 khi một client gửi quá nhiều request cùng lúc
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_deadline(deadline_ms, default_ms=0): # Đổi thời hạn (mili giây kể từ lúc nhận request) thành mốc time.monotonic()
+    try:
+        deadline_ms = float(deadline_ms) if deadline_ms not in (None, "") else default_ms
+    except ValueError:
+        deadline_ms = default_ms
+    return time.monotonic() + deadline_ms / 1000.0 if deadline_ms and deadline_ms > 0 else None
+
+
+def check_deadline(deadline): # Bỏ việc còn lại nếu client đã hết thời gian chờ
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("Đã quá thời hạn xử lý request")
+
+
+def remaining(deadline, default=None): # Số giây còn lại trước deadline (không âm), default nếu không có deadline
+    if deadline is None:
+        return default
+    left = max(0.0, deadline - time.monotonic())
+    return left if default is None else min(left, default)
+
+
+class AdmissionController:
+    # Giới hạn số request nhận diện đang xử lý trên toàn server và theo từng client (0 = không giới hạn)
+    # Request vượt giới hạn bị từ chối ngay thay vì xếp hàng chờ model
+    def __init__(self, max_in_flight=0, max_per_client=0, retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.max_per_client = max_per_client
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.per_client = {}
+        self.rejected = {429: 0, 503: 0}
+        self.lock = threading.Lock()
+
+    def admit(self, client): # Nhận request của client, AdmissionRejected nếu vượt giới hạn; phải gọi release() sau đó
+        with self.lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected[503] += 1
+                raise AdmissionRejected(503, "Server đang quá tải, vui lòng thử lại sau", self.retry_after)
+            count = self.per_client.get(client, 0)
+            if self.max_per_client and count >= self.max_per_client:
+                self.rejected[429] += 1
+                raise AdmissionRejected(429, "Client gửi quá nhiều request cùng lúc", self.retry_after)
+            self.in_flight += 1
+            self.per_client[client] = count + 1
+
+    def release(self, client):
+        with self.lock:
+            self.in_flight -= 1
+            count = self.per_client.get(client, 0) - 1
+            if count > 0:
+                self.per_client[client] = count
+            else:
+                self.per_client.pop(client, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "clients": len(self.per_client),
+                "max_in_flight": self.max_in_flight,
+                "max_per_client": self.max_per_client,
+                "rejected": dict(self.rejected),
+            }
@@ -0,0 +1,242 @@
+import os
+import time
+import asyncio
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+import Call_API
+from admission import AdmissionRejected, DeadlineExceeded, parse_deadline
+from metrics import Counter, begin_timings, end_timings, server_timing_header
+
+# Chế độ ASGI: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+# /detect/image/, /health, /ready chạy bất đồng bộ; các route còn lại của Call_API chạy qua WSGI trong threadpool
+ASGI_INFERENCE_THREADS = int(os.environ.get("ASGI_INFERENCE_THREADS", 32))
+# Giới hạn kích thước ảnh upload dạng body thô (MB)
+ASGI_MAX_UPLOAD_MB = int(os.environ.get("ASGI_MAX_UPLOAD_MB", 32))
+# Số frame tối đa chờ xử lý trên mỗi kết nối WebSocket, đầy thì bỏ frame cũ nhất
+WS_QUEUE_SIZE = int(os.environ.get("WS_QUEUE_SIZE", 4))
+ws_frames_dropped = Counter(Call_API.registry, "ws_frames_dropped_total", "Số frame WebSocket bị bỏ vì hàng đợi đầy")
+
+# Giải mã + nhận diện chạy trong executor (BatchScheduler / worker pool gom batch phía sau), event loop luôn rảnh
+inference_executor = ThreadPoolExecutor(max_workers=ASGI_INFERENCE_THREADS, thread_name_prefix="asgi-inference")
+
+
+def to_asgi_response(status, mimetype, body): # Đổi kết quả (status, mimetype, body) thành response Starlette
+    if isinstance(body, dict):
+        return JSONResponse(body, status_code=status)
+    return Response(body, status_code=status, media_type=mimetype)
+
+
+async def read_raw_body(request): # Đọc body thô theo từng chunk, dừng sớm nếu vượt giới hạn
+    limit = ASGI_MAX_UPLOAD_MB * 1024 * 1024
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > limit:
+            return None
+    return bytes(body)
+
+
+def run_timed(function, *args): # Chạy trong executor, trả về (kết quả, thời gian từng bước) để tạo header Server-Timing
+    begin_timings()
+    try:
+        return function(*args), end_timings()
+    finally:
+        end_timings()
+
+
+def overloaded_response(status, message, retry_after):
+    return JSONResponse({"error": message, "retry_after": retry_after}, status_code=status,
+                        headers={"Retry-After": str(retry_after)})
+
+
+def client_id(connection): # Giống Call_API.request_client_id: header X-Client-Id hoặc địa chỉ IP
+    return connection.headers.get("x-client-id") or (connection.client.host if connection.client else "unknown")
+
+
+async def detect_image(request):
+    # Ghi metrics và admission control giống các route Flask (before_request / after_request không chạy với route ASGI)
+    started = time.perf_counter()
+    Call_API.http_in_flight.inc("/detect/image/")
+    client = client_id(request)
+    deadline = parse_deadline(request.headers.get("x-request-deadline-ms", request.query_params.get("deadline_ms")),
+                              Call_API.DETECT_DEADLINE_MS)
+    try:
+        Call_API.admission.admit(client)
+    except AdmissionRejected as e:
+        Call_API.admission_rejected.inc(e.status)
+        response = overloaded_response(e.status, str(e), e.retry_after)
+    else:
+        try:
+            response = await handle_detect_image(request, deadline)
+        finally:
+            Call_API.admission.release(client)
+    finally:
+        Call_API.http_in_flight.dec("/detect/image/")
+    seconds = time.perf_counter() - started
+    Call_API.http_requests.inc("/detect/image/", "POST", response.status_code)
+    Call_API.http_request_seconds.observe(seconds, "/detect/image/")
+    return response
+
+
+async def handle_detect_image(request, deadline=None):
+    try:
+        params = dict(request.query_params)
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            # Starlette parse multipart theo luồng, file lớn được ghi tạm ra đĩa thay vì giữ trong RAM
+            form = await request.form()
+            file = form.get("file")
+            if file is None or isinstance(file, str):
+                return JSONResponse({"error": "Không tìm thấy file trong request"}, status_code=400)
+            if not file.filename:
+                return JSONResponse({"error": "File rỗng"}, status_code=400)
+            image_bytes = await file.read()
+            for name in ("format", "conf", "classes", "imgsz", "roi"):
+                if name not in params and isinstance(form.get(name), str):
+                    params[name] = form.get(name)
+        else:
+            # Body thô (vd. Content-Type: image/jpeg)
+            image_bytes = await read_raw_body(request)
+            if image_bytes is None:
+                return JSONResponse({"error": "File quá lớn"}, status_code=413)
+            if not image_bytes:
+                return JSONResponse({"error": "File rỗng"}, status_code=400)
+
+        min_confidence, labels = Call_API.parse_filter_params(params.get("conf"), params.get("classes"))
+        try:
+            imgsz, rois = Call_API.parse_inference_params(params.get("imgsz"), params.get("roi"))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        # Client đã ngắt kết nối trong lúc upload: không đưa ảnh vào model
+        if await request.is_disconnected():
+            Call_API.deadline_exceeded.inc("/detect/image/")
+            return JSONResponse({"error": "Client đã ngắt kết nối"}, status_code=499)
+        loop = asyncio.get_running_loop()
+        result, timings = await loop.run_in_executor(inference_executor, run_timed, Call_API.process_image_bytes,
+                                                     image_bytes, params.get("format", "json"), min_confidence, labels,
+                                                     imgsz, rois, deadline)
+        response = to_asgi_response(*result)
+        if Call_API.SERVER_TIMING and timings:
+            response.headers["Server-Timing"] = server_timing_header(timings)
+        return response
+
+    except DeadlineExceeded as e:
+        Call_API.deadline_exceeded.inc("/detect/image/")
+        return overloaded_response(503, str(e), Call_API.ADMISSION_RETRY_AFTER)
+    except Call_API.ModelUnavailable as e:
+        Call_API.detect_errors.inc("/detect/image/", "model_unavailable")
+        return JSONResponse({"error": str(e)}, status_code=503)
+    except Exception as e:
+        Call_API.detect_errors.inc("/detect/image/", type(e).__name__)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def detect_stream(websocket):
+    # Kênh WebSocket cho camera: client gửi message nhị phân = seq (uint32 big-endian) + bytes JPEG,
+    # server trả JSON {"seq", "detections", "result_id"}; frame bị bỏ được báo bằng {"seq", "dropped": true}
+    await websocket.accept()
+    min_confidence, labels = Call_API.parse_filter_params(websocket.query_params.get("conf"),
+                                                          websocket.query_params.get("classes"))
+    try:
+        imgsz, rois = Call_API.parse_inference_params(websocket.query_params.get("imgsz"),
+                                                      websocket.query_params.get("roi"))
+    except ValueError as e:
+        await websocket.send_json({"status": 400, "error": str(e)})
+        await websocket.close(code=1008)
+        return
+    frames = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+    loop = asyncio.get_running_loop()
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if not data or len(data) < 4:
+                continue
+            seq = struct.unpack(">I", data[:4])[0]
+            if frames.full():
+                # Backpressure: giữ frame mới nhất, báo cho client frame cũ đã bị bỏ
+                old_seq, _ = frames.get_nowait()
+                ws_frames_dropped.inc()
+                await websocket.send_json({"seq": old_seq, "dropped": True})
+            frames.put_nowait((seq, data[4:]))
+
+    client = client_id(websocket)
+
+    async def process_frames():
+        while True:
+            seq, image_bytes = await frames.get()
+            # Mỗi frame cũng phải qua admission control: khi quá tải, trả lỗi cho frame thay vì xếp hàng
+            try:
+                Call_API.admission.admit(client)
+            except AdmissionRejected as e:
+                Call_API.admission_rejected.inc(e.status)
+                await websocket.send_json({"seq": seq, "status": e.status, "error": str(e), "retry_after": e.retry_after})
+                continue
+            try:
+                status, _, body = await loop.run_in_executor(inference_executor, Call_API.process_image_bytes,
+                                                             image_bytes, "detections", min_confidence, labels,
+                                                             imgsz, rois)
+                body = dict(body, seq=seq, status=status)
+            except Call_API.ModelUnavailable as e:
+                Call_API.detect_errors.inc("/ws/detect", "model_unavailable")
+                body = {"seq": seq, "status": 503, "error": str(e)}
+            except Exception as e:
+                Call_API.detect_errors.inc("/ws/detect", type(e).__name__)
+                body = {"seq": seq, "status": 500, "error": str(e)}
+            finally:
+                Call_API.admission.release(client)
+            await websocket.send_json(body)
+
+    def processor_done(task): # Lỗi làm process_frames dừng thì ghi log và đóng kết nối thay vì im lặng bỏ qua
+        if task.cancelled() or task.exception() is None or isinstance(task.exception(), WebSocketDisconnect):
+            return
+        error = task.exception()
+        print(f"Lỗi xử lý frame WebSocket: {error!r}")
+        Call_API.detect_errors.inc("/ws/detect", type(error).__name__)
+        asyncio.ensure_future(close_with_error())
+
+    async def close_with_error():
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+
+    processor = asyncio.create_task(process_frames())
+    processor.add_done_callback(processor_done)
+    try:
+        await receive_frames()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        processor.cancel()
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def ready(request):
+    with Call_API.app.app_context():
+        response, status = Call_API.ready()
+    return Response(response.get_data(), status_code=status, media_type="application/json")
+
+
+app = Starlette(routes=[
+    Route("/detect/image/", detect_image, methods=["POST"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/ready", ready, methods=["GET"]),
+    WebSocketRoute("/ws/detect", detect_stream),
+    Mount("/", app=WSGIMiddleware(Call_API.app)),
+])
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,86 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+from admission import DeadlineExceeded
+
+
+class BatchScheduler:
+    # Gom nhiều request nhận diện thành một batch rồi chạy model một lần
+    # on_batch(batch_size, seconds): nếu có, được gọi sau mỗi lần chạy model (dùng cho metrics)
+    def __init__(self, model, max_batch_size=8, max_wait_ms=5, on_batch=None):
+        self.model = model
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="batch-scheduler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, image, imgsz=None, deadline=None): # Đưa ảnh vào hàng đợi, trả về Future chứa kết quả của ảnh đó
+        # deadline (mốc time.monotonic()): ảnh chưa được chạy khi quá hạn sẽ bị bỏ
+        future = Future()
+        self.requests.put((image, imgsz, future, deadline))
+        return future
+
+    def submit_many(self, images, imgsz=None, deadline=None): # Đưa nhiều ảnh (frame video, batch ảnh) vào cùng hàng đợi, trả về danh sách Future
+        # Mọi lần gọi model đều đi qua thread này, kể cả batch lớn (model không an toàn khi nhiều thread gọi với imgsz khác nhau)
+        return [self.submit(image, imgsz, deadline) for image in images]
+
+    def predict(self, image, imgsz=None, timeout=None): # Gửi ảnh và chờ kết quả (dùng trong các route Flask)
+        return self.submit(image, imgsz).result(timeout=timeout)
+
+    def collect_batch(self): # Lấy request đầu tiên rồi chờ thêm tối đa max_wait để gom batch
+        try:
+            first = self.requests.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self): # Vòng lặp của thread xử lý batch
+        while self.running:
+            batch = self.collect_batch()
+            if not batch:
+                continue
+            # Bỏ qua các request mà client đã hủy
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            # Các ảnh cùng imgsz chạy chung một lần gọi model, ảnh đã quá hạn không chạy
+            now = time.monotonic()
+            groups = {}
+            for image, imgsz, future, deadline in batch:
+                if deadline is not None and now >= deadline:
+                    future.set_exception(DeadlineExceeded("Đã quá thời hạn xử lý request"))
+                    continue
+                groups.setdefault(imgsz, []).append((image, future))
+            for imgsz, group in groups.items():
+                self.run_group(group, imgsz)
+
+    def run_group(self, group, imgsz):
+        images = [image for image, _ in group]
+        started = time.perf_counter()
+        try:
+            results = self.model(images) if imgsz is None else self.model(images, imgsz=imgsz)
+        except Exception as e:
+            for _, future in group:
+                future.set_exception(e)
+            return
+        if self.on_batch is not None:
+            self.on_batch(len(images), time.perf_counter() - started)
+        for (_, future), result in zip(group, results):
+            future.set_result(result)
+
+    def stop(self): # Dừng thread xử lý batch
+        self.running = False
+        self.thread.join(timeout=1)
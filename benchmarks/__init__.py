@@ -0,0 +1,2 @@
+# Bộ benchmark: python -m benchmarks.micro (từng bước, trong process), python -m benchmarks.load (tải đầu-cuối qua HTTP),
+# python -m benchmarks.compare (so sánh hai file kết quả JSON)
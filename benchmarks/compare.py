@@ -0,0 +1,33 @@
+import sys
+import json
+
+# python -m benchmarks.compare baseline.json candidate.json: so sánh p50/p95/p99 và thông lượng giữa hai lần chạy
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_per_s")
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Cách dùng: python -m benchmarks.compare baseline.json candidate.json")
+        sys.exit(2)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(sys.argv[2], encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"baseline: {baseline['environment'].get('git_commit')}  candidate: {candidate['environment'].get('git_commit')}")
+    print(f"{'benchmark':<28}" + "".join(f"{name:>22}" for name in METRICS))
+    for name, new in candidate["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        cells = [f"{old[metric]} -> {new[metric]} ({change(old[metric], new[metric])})" for metric in METRICS]
+        print(f"{name:<28}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
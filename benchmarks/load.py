@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+import json
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+import requests
+from benchmarks.stats import summarize, write_report, print_results
+from benchmarks.synthetic import synthetic_jpeg, synthetic_video
+
+# python -m benchmarks.load --start-server --targets image,video,images --concurrency 8 --duration 15
+# --start-server: chạy Call_API trong thư mục tạm với model giả (INFERENCE_BACKEND=stub), không cần mạng hay GPU
+# Cache kết quả của server bị tắt (RESULT_CACHE_MAX=0) để mỗi request đều chạy model, trừ khi có --result-cache;
+# với --url, --image-variants lớn hơn RESULT_CACHE_MAX của server để tránh cache hit
+TARGETS = ("image", "video", "images")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(port, stub_latency_ms, workdir, result_cache=False, extra_env=None): # Chạy server trong process con, chờ /ready
+    env = dict(os.environ, INFERENCE_BACKEND="stub", MODEL_LOADING="background", STUB_LATENCY_MS=str(stub_latency_ms),
+               PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    if not result_cache:
+        env["RESULT_CACHE_MAX"] = "0"
+    env.update(extra_env or {})
+    code = f"import Call_API; Call_API.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server dừng khi đang khởi động")
+        try:
+            if requests.get(f"{url}/ready", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server không sẵn sàng sau 60 giây")
+
+
+def seed_images(url, count): # Thêm bản ghi để /images/ có dữ liệu trả về
+    session = requests.Session()
+    detections = [{"label": "car", "confidence": 0.8, "box": [10, 10, 100, 80]}]
+    for i in range(count):
+        session.post(f"{url}/save_image/", json={"file_path": f"bench_{i}.jpg", "detections": detections}, timeout=10)
+
+
+def build_request(target, args, payloads): # Trả về hàm gửi một request bằng session cho trước
+    if target == "image":
+        params = {"format": args.format}
+        images = payloads["images"]
+        counter = itertools.count()
+
+        # Lần lượt gửi các ảnh khác nhau để cache kết quả của server không trả lời thay model
+        return lambda session: session.post(f"{args.url}/detect/image/", params=params, timeout=args.timeout,
+                                            files={"file": ("bench.jpg", images[next(counter) % len(images)], "image/jpeg")})
+    if target == "video":
+        params = {"mode": "stream"} if args.video_mode == "stream" else {}
+
+        def send(session):
+            # Đọc hết body (stream NDJSON) để thời gian đo bao gồm toàn bộ video
+            response = session.post(f"{args.url}/detect/video/", params=params, timeout=args.timeout, stream=True,
+                                    files={"file": ("bench.mp4", payloads["video"], "video/mp4")})
+            for _ in response.iter_content(chunk_size=65536):
+                pass
+            return response
+        return send
+    params = {"limit": args.page_size, "include_detections": 1}
+    return lambda session: session.get(f"{args.url}/images/", params=params, timeout=args.timeout)
+
+
+def parse_server_timing(header): # "decode;dur=1.2, inference;dur=30" -> {"decode": 1.2, "inference": 30.0}
+    stages = {}
+    for part in header.split(","):
+        name, _, rest = part.strip().partition(";")
+        if rest.startswith("dur="):
+            try:
+                stages[name] = float(rest[4:])
+            except ValueError:
+                pass
+    return stages
+
+
+def run_target(target, args, payloads): # Chạy args.concurrency thread gửi request liên tục trong args.duration giây
+    send = build_request(target, args, payloads)
+    latencies, statuses, stage_totals = [], {}, {}
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def worker(index):
+        nonlocal errors
+        session = requests.Session()
+        # Mỗi thread là một client riêng đối với giới hạn theo client của server (ADMISSION_MAX_PER_CLIENT)
+        session.headers["X-Client-Id"] = f"bench-{index}"
+        sent = 0
+        while time.monotonic() < deadline and (args.requests is None or sent < args.requests):
+            sent += 1
+            started = time.perf_counter()
+            try:
+                response = send(session)
+                elapsed = time.perf_counter() - started
+            except requests.RequestException:
+                with lock:
+                    errors += 1
+                continue
+            stages = parse_server_timing(response.headers.get("Server-Timing", ""))
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+                for name, duration in stages.items():
+                    stage_totals.setdefault(name, []).append(duration)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = summarize(latencies, time.perf_counter() - started, errors)
+    summary["status_codes"] = {str(code): count for code, count in sorted(statuses.items())}
+    summary["server_timing_mean_ms"] = {name: round(sum(values) / len(values), 3) for name, values in stage_totals.items()}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo tải đầu-cuối cho API nhận diện")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--start-server", action="store_true", help="Tự chạy server với model giả trong thư mục tạm")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--stub-latency-ms", type=float, default=5.0)
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Các route cần đo: " + ",".join(TARGETS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=15, help="Số giây chạy mỗi route")
+    parser.add_argument("--requests", type=int, default=None, help="Giới hạn số request mỗi thread (mặc định: chạy hết duration)")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--image-variants", type=int, default=64, help="Số ảnh khác nhau gửi xoay vòng tới /detect/image/ (với --url: đặt lớn hơn RESULT_CACHE_MAX của server)")
+    parser.add_argument("--result-cache", action="store_true", help="Giữ cache kết quả của server khi dùng --start-server")
+    parser.add_argument("--format", default="detections", help="format của /detect/image/ (json, detections, multipart, msgpack)")
+    parser.add_argument("--video-frames", type=int, default=30)
+    parser.add_argument("--video-mode", default="stream", choices=("first", "stream"))
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--seed-images", type=int, default=200, help="Số bản ghi thêm vào CSDL khi dùng --start-server")
+    parser.add_argument("--output", default="benchmark_load.json")
+    args = parser.parse_args()
+
+    targets = [name.strip() for name in args.targets.split(",") if name.strip() in TARGETS]
+    with tempfile.TemporaryDirectory() as workdir:
+        payloads = {"images": [synthetic_jpeg(args.width, args.height, seed=seed) for seed in range(max(1, args.image_variants))]}
+        if "video" in targets:
+            with open(synthetic_video(os.path.join(workdir, "bench.mp4"), frames=args.video_frames), "rb") as f:
+                payloads["video"] = f.read()
+
+        server = None
+        if args.start_server:
+            server, args.url = start_server(args.port, args.stub_latency_ms, workdir, result_cache=args.result_cache)
+        try:
+            if args.start_server and "images" in targets:
+                seed_images(args.url, args.seed_images)
+            results = {}
+            for target in targets:
+                print(f"Đang đo {target} ({args.concurrency} luồng, {args.duration} giây)...")
+                results[target] = run_target(target, args, payloads)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    print_results(results)
+    for target, summary in results.items():
+        if summary["server_timing_mean_ms"]:
+            print(f"{target} Server-Timing (ms): {json.dumps(summary['server_timing_mean_ms'])}")
+    config = vars(args)
+    # Cache của server ngoài (--url) không biết được; server tự chạy tắt cache trừ khi có --result-cache
+    config["server_result_cache"] = ("enabled" if args.result_cache else "disabled") if args.start_server else "unknown"
+    write_report(args.output, "load", config, results)
+    print(f"Đã ghi kết quả vào {args.output}")
+
+
+if __name__ == "__main__":
+    main()
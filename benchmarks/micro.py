@@ -0,0 +1,166 @@
+import os
+import time
+import base64
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from benchmarks.stats import summarize, write_report, print_results
+from benchmarks.synthetic import synthetic_jpeg
+from benchmarks.stub_model import StubModel
+from ingest import decode_image, letterbox
+from postprocess import extract_detections
+from init_db import init_db, insert_detections
+from db_pool import SQLitePool
+
+# python -m benchmarks.micro [--backend stub|pytorch|onnx|openvino] [--only decode,db] [--output benchmark_micro.json]
+GROUPS = ("decode", "inference", "postprocess", "encode", "db")
+
+
+def measure(function, iterations, warmup): # Chạy function nhiều lần, trả về số liệu thời gian
+    for _ in range(warmup):
+        function()
+    latencies = []
+    errors = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        try:
+            function()
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, errors=errors)
+
+
+def load_benchmark_model(args):
+    if args.backend == "stub":
+        return StubModel(latency_ms=args.stub_latency_ms, num_detections=args.stub_detections)
+    from inference_backend import load_model
+    return load_model(args.model, args.backend, args.imgsz)
+
+
+def bench_decode(args, jpeg, results):
+    results["decode_full"] = measure(lambda: cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR),
+                                     args.iterations, args.warmup)
+    results["decode_reduced"] = measure(lambda: decode_image(jpeg, args.imgsz), args.iterations, args.warmup)
+    image, _ = decode_image(jpeg)
+    results["letterbox"] = measure(lambda: letterbox(image, args.imgsz), args.iterations, args.warmup)
+
+
+def bench_inference(args, model, canvas, results):
+    results["inference_single"] = measure(lambda: model(canvas, imgsz=args.imgsz), args.iterations, args.warmup)
+    batch = [canvas] * args.batch_size
+    summary = measure(lambda: model(batch, imgsz=args.imgsz), max(1, args.iterations // args.batch_size), args.warmup)
+    # Thông lượng tính theo số ảnh, không phải số lần gọi model
+    if summary["throughput_per_s"]:
+        summary["throughput_per_s"] = round(summary["throughput_per_s"] * args.batch_size, 3)
+    summary["batch_size"] = args.batch_size
+    results[f"inference_batch_{args.batch_size}"] = summary
+
+
+def bench_postprocess(args, model, canvas, results):
+    result = model(canvas, imgsz=args.imgsz)[0]
+    results["postprocess"] = measure(lambda: extract_detections(result), args.iterations, args.warmup)
+    results["postprocess_filtered"] = measure(lambda: extract_detections(result, 0.5, ["person", "car"]),
+                                              args.iterations, args.warmup)
+
+
+def bench_encode(args, image, results):
+    results["encode_jpeg"] = measure(lambda: cv2.imencode(".jpg", image), args.iterations, args.warmup)
+    _, buffer = cv2.imencode(".jpg", image)
+    results["encode_base64"] = measure(lambda: base64.b64encode(buffer).decode("utf-8"), args.iterations, args.warmup)
+
+
+def bench_db(args, results): # CRUD trên CSDL tạm (không đụng tới data_images.db)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        init_db(db_path)
+        pool = SQLitePool(db_path)
+        detections = [{"label": ("person", "car", "bus")[i % 3], "confidence": 0.5 + i * 0.05, "box": [i, i, i + 50, i + 80]}
+                      for i in range(5)]
+        ids = []
+
+        def insert():
+            conn = pool.acquire()
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO images (file_path, detections) VALUES (?, ?)", ("bench.jpg", "[]"))
+            insert_detections(cursor, cursor.lastrowid, detections)
+            ids.append(cursor.lastrowid)
+            conn.commit()
+            conn.close()
+
+        def run_query(sql, params=()):
+            conn = pool.acquire()
+            conn.execute(sql, params).fetchall()
+            conn.close()
+
+        results["db_insert"] = measure(insert, args.iterations, args.warmup)
+        results["db_select_by_id"] = measure(lambda: run_query("SELECT * FROM images WHERE id = ?", (ids[len(ids) // 2],)),
+                                             args.iterations, args.warmup)
+        results["db_list_page"] = measure(lambda: run_query("SELECT id, file_path, notes FROM images WHERE id > ? ORDER BY id LIMIT 100",
+                                                            (ids[0],)), args.iterations, args.warmup)
+        results["db_search_label"] = measure(lambda: run_query(
+            "SELECT DISTINCT image_id FROM detections WHERE label = ? AND confidence >= ? LIMIT 100", ("car", 0.6)),
+            args.iterations, args.warmup)
+
+        def update():
+            conn = pool.acquire()
+            conn.execute("UPDATE images SET notes = ? WHERE id = ?", ("benchmark", ids[len(ids) // 2]))
+            conn.commit()
+            conn.close()
+
+        def delete():
+            conn = pool.acquire()
+            image_id = ids.pop()
+            conn.execute("DELETE FROM detections WHERE image_id = ?", (image_id,))
+            conn.execute("DELETE FROM images WHERE id = ?", (image_id,))
+            conn.commit()
+            conn.close()
+
+        results["db_update"] = measure(update, args.iterations, args.warmup)
+        results["db_delete"] = measure(delete, min(args.iterations, len(ids) - args.warmup - 1), args.warmup)
+        pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark từng bước xử lý (chạy trong process, không cần server)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--backend", default="stub", help="stub (mặc định, không cần model thật), pytorch, onnx, openvino")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "yolov8n.pt"))
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--stub-detections", type=int, default=20)
+    parser.add_argument("--only", default=",".join(GROUPS), help="Các nhóm cần chạy, cách nhau bởi dấu phẩy: " + ",".join(GROUPS))
+    parser.add_argument("--output", default="benchmark_micro.json")
+    args = parser.parse_args()
+
+    groups = {name.strip() for name in args.only.split(",") if name.strip()}
+    jpeg = synthetic_jpeg(args.width, args.height)
+    image, _ = decode_image(jpeg)
+    canvas = letterbox(image, args.imgsz)[0].copy()
+    results = {}
+    if "decode" in groups:
+        bench_decode(args, jpeg, results)
+    if groups & {"inference", "postprocess"}:
+        model = load_benchmark_model(args)
+        if "inference" in groups:
+            bench_inference(args, model, canvas, results)
+        if "postprocess" in groups:
+            bench_postprocess(args, model, canvas, results)
+    if "encode" in groups:
+        bench_encode(args, image, results)
+    if "db" in groups:
+        bench_db(args, results)
+
+    print_results(results)
+    write_report(args.output, "micro", vars(args), results)
+    print(f"Đã ghi kết quả vào {args.output}")
+
+
+if __name__ == "__main__":
+    main()
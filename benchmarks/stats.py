@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+
+def percentile(sorted_values, fraction): # Nội suy tuyến tính giữa hai mẫu gần nhất
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, elapsed=None, errors=0): # Tóm tắt danh sách thời gian (giây) thành số liệu mili giây
+    values = sorted(latencies)
+    total = sum(values)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(total / len(values) * 1000, 3) if values else None,
+        "min_ms": round(values[0] * 1000, 3) if values else None,
+        "max_ms": round(values[-1] * 1000, 3) if values else None,
+    }
+    for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        value = percentile(values, fraction)
+        summary[name] = round(value * 1000, 3) if value is not None else None
+    # Không có elapsed (chạy tuần tự): thông lượng = số lần / tổng thời gian
+    duration = elapsed if elapsed is not None else total
+    summary["throughput_per_s"] = round(len(values) / duration, 3) if duration else None
+    return summary
+
+
+def git_commit(): # Commit hiện tại để biết kết quả thuộc phiên bản code nào
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).decode().strip()
+    except Exception:
+        return None
+
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_report(path, kind, config, results): # Ghi kết quả ra file JSON (so sánh bằng python -m benchmarks.compare)
+    report = {"kind": kind, "environment": environment(), "config": config, "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+def print_results(results):
+    print(f"{'benchmark':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'errors':>8}")
+    for name, summary in results.items():
+        print(f"{name:<28}{summary['count']:>8}{fmt(summary['p50_ms']):>10}{fmt(summary['p95_ms']):>10}"
+              f"{fmt(summary['p99_ms']):>10}{fmt(summary['throughput_per_s']):>10}{summary['errors']:>8}")
+
+
+def fmt(value):
+    return "-" if value is None else f"{value:.2f}"
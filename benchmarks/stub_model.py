@@ -0,0 +1,63 @@
+import os
+import time
+import cv2
+import numpy as np
+
+# Model giả thay cho YOLO (INFERENCE_BACKEND=stub): không cần ultralytics, GPU hay tải trọng số
+# STUB_LATENCY_MS: thời gian giả lập cho mỗi ảnh, STUB_DETECTIONS: số box trả về mỗi ảnh
+STUB_LATENCY_MS = float(os.environ.get("STUB_LATENCY_MS", 5))
+STUB_DETECTIONS = int(os.environ.get("STUB_DETECTIONS", 5))
+STUB_NAMES = {0: "person", 1: "bicycle", 2: "car", 3: "motorcycle", 4: "bus", 5: "truck"}
+
+
+class StubTensor:
+    # Giống torch.Tensor ở mức mà postprocess.extract_arrays cần: .cpu().numpy()
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class StubBoxes:
+    def __init__(self, data):
+        self.data = StubTensor(data)
+
+    def __len__(self):
+        return len(self.data.array)
+
+
+class StubResult:
+    def __init__(self, data, names):
+        self.boxes = StubBoxes(data)
+        self.names = names
+
+
+class StubModel:
+    # Gọi giống YOLO: model(image hoặc list ảnh, imgsz=...) -> list kết quả có .boxes.data và .names
+    def __init__(self, latency_ms=STUB_LATENCY_MS, num_detections=STUB_DETECTIONS, names=None):
+        self.latency = latency_ms / 1000.0
+        self.num_detections = num_detections
+        self.names = names or STUB_NAMES
+
+    def __call__(self, images, imgsz=640, **kwargs):
+        if isinstance(images, np.ndarray) and images.ndim == 3:
+            images = [images]
+        results = [self.predict_one(image, imgsz) for image in images]
+        if self.latency:
+            time.sleep(self.latency * len(images))
+        return results
+
+    def predict_one(self, image, imgsz): # Thu nhỏ ảnh như bước tiền xử lý thật, box xác định theo kích thước ảnh
+        height, width = image.shape[:2]
+        ratio = min(imgsz / height, imgsz / width, 1.0)
+        cv2.resize(image, (max(1, int(width * ratio)), max(1, int(height * ratio))), interpolation=cv2.INTER_LINEAR)
+        rows = []
+        for i in range(self.num_detections):
+            x1 = width * (i % 4) / 4
+            y1 = height * (i // 4 % 4) / 4
+            rows.append([x1, y1, x1 + width / 5, y1 + height / 5, 0.9 - 0.1 * (i % 8), i % len(self.names)])
+        return StubResult(np.asarray(rows, dtype=np.float32).reshape(-1, 6), self.names)
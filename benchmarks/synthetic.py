@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+
+def synthetic_image(width=1280, height=720, seed=0): # Ảnh giả có chi tiết giống ảnh thật (nền chuyển màu, hình khối, nhiễu), cố định theo seed
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x * 0.6 + y * 0.4).astype(np.uint8)
+    image[..., 1] = (255 - x * 0.5).astype(np.uint8)
+    image[..., 2] = (y * 0.8).astype(np.uint8)
+    for _ in range(12):
+        x1, y1 = int(rng.integers(0, width - 20)), int(rng.integers(0, height - 20))
+        x2, y2 = x1 + int(rng.integers(20, width // 4)), y1 + int(rng.integers(20, height // 4))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, -1)
+    noise = rng.integers(-12, 13, image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_jpeg(width=1280, height=720, seed=0, quality=90):
+    _, buffer = cv2.imencode(".jpg", synthetic_image(width, height, seed), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def synthetic_video(path, width=640, height=360, frames=60, fps=30): # Ghi video mp4 ngắn (ảnh nền di chuyển dần)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    base = synthetic_image(width * 2, height, seed=1)
+    for i in range(frames):
+        offset = int(i * width / max(1, frames))
+        writer.write(np.ascontiguousarray(base[:, offset:offset + width]))
+    writer.release()
+    return path
@@ -0,0 +1,157 @@
+import threading
+import queue
+import itertools
+import json
+import struct
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_session(pool_size=4): # Session dùng chung, giữ kết nối keep-alive tới API
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class FramePipeline:
+    # Pipeline gửi frame: capture -> encode -> upload -> render
+    # Giới hạn số request đang chờ, frame mới bị bỏ khi đầy, kết quả cũ bị bỏ khi đã có kết quả mới hơn
+    def __init__(self, session, url, max_in_flight=3, params=None, timeout=10):
+        self.session = session
+        self.url = url
+        self.params = params
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="frame-upload")
+        self.results = queue.Queue()
+        self.seq = itertools.count()
+        self.last_result_seq = -1
+        self.dropped_frames = 0
+
+    def submit(self, frame, block=False): # Trả về False nếu frame bị bỏ vì pipeline đang đầy
+        if not self.slots.acquire(blocking=block):
+            self.dropped_frames += 1
+            return False
+        self.executor.submit(self.upload, next(self.seq), frame)
+        return True
+
+    def upload(self, seq, frame): # Chạy trong thread pool: mã hóa JPEG và gửi lên API
+        try:
+            _, buffer = cv2.imencode(".jpg", frame)
+            files = {"file": ("frame.jpg", buffer.tobytes(), "image/jpeg")}
+            # Server bỏ frame nếu chưa xử lý xong khi client đã hết thời gian chờ
+            headers = {"X-Request-Deadline-Ms": str(int(self.timeout * 1000))}
+            response = self.session.post(self.url, files=files, params=self.params, headers=headers, timeout=self.timeout)
+            if response.status_code == 200:
+                self.results.put((seq, frame, response.json(), None))
+            else:
+                self.results.put((seq, frame, None, f"Lỗi từ API: {response.status_code} - {response.text}"))
+        except Exception as e:
+            self.results.put((seq, frame, None, f"Lỗi: {str(e)}"))
+        finally:
+            self.slots.release()
+
+    def get_latest(self, timeout=None): # Lấy kết quả mới nhất (seq, frame, data, error), bỏ các kết quả cũ
+        items = []
+        try:
+            if timeout is None:
+                items.append(self.results.get_nowait())
+            else:
+                items.append(self.results.get(timeout=timeout))
+            while True:
+                items.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        if not items:
+            return None
+        newest = max(items, key=lambda item: item[0])
+        if newest[0] <= self.last_result_seq:
+            return None
+        self.last_result_seq = newest[0]
+        return newest
+
+    def close(self): # Dừng pipeline, hủy các frame chưa gửi
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WebSocketFramePipeline(FramePipeline):
+    # Cùng giao diện với FramePipeline nhưng gửi mọi frame qua một kết nối WebSocket (/ws/detect)
+    # Message gửi đi: seq (uint32 big-endian) + bytes JPEG; server trả JSON có seq tương ứng
+    def __init__(self, url, max_in_flight=3, params=None, timeout=10):
+        import websocket  # thư viện websocket-client, chỉ cần khi dùng chế độ này
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        self.ws = websocket.create_connection(url, timeout=timeout)
+        self.ws.settimeout(None)
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.results = queue.Queue()
+        self.seq = itertools.count()
+        self.last_result_seq = -1
+        self.dropped_frames = 0
+        self.frames = {}  # seq -> frame đang chờ kết quả, mỗi frame giữ một slot
+        self.lock = threading.Lock()
+        self.closed = False
+        self.receiver = threading.Thread(target=self.receive, name="ws-receive")
+        self.receiver.daemon = True
+        self.receiver.start()
+
+    def submit(self, frame, block=False):
+        if self.closed or not self.slots.acquire(blocking=block):
+            self.dropped_frames += 1
+            return False
+        seq = next(self.seq) & 0xFFFFFFFF
+        _, buffer = cv2.imencode(".jpg", frame)
+        with self.lock:
+            self.frames[seq] = frame
+        try:
+            self.ws.send_binary(struct.pack(">I", seq) + buffer.tobytes())
+        except Exception as e:
+            # Thread nhận có thể đã trả slot của frame này khi mất kết nối
+            self.release_frame(seq)
+            self.results.put((seq, frame, None, f"Lỗi: {str(e)}"))
+            return False
+        return True
+
+    def release_frame(self, seq): # Bỏ frame khỏi danh sách chờ và trả slot đúng một lần, None nếu đã được trả
+        with self.lock:
+            frame = self.frames.pop(seq, None)
+        if frame is not None:
+            self.slots.release()
+        return frame
+
+    def receive(self): # Thread nhận kết quả từ server
+        while not self.closed:
+            try:
+                data = json.loads(self.ws.recv())
+            except Exception as e:
+                if not self.closed:
+                    # Mất kết nối: trả lại slot của các frame đang chờ để submit không bị treo
+                    self.closed = True
+                    with self.lock:
+                        pending = list(self.frames)
+                    for seq in pending:
+                        self.release_frame(seq)
+                    self.results.put((self.last_result_seq + 1, None, None, f"Lỗi: {str(e)}"))
+                return
+            frame = self.release_frame(data.get("seq"))
+            if frame is None:
+                continue
+            if data.get("dropped"):
+                # Server bỏ frame này vì hàng đợi đầy
+                self.dropped_frames += 1
+            elif data.get("status", 200) == 200:
+                self.results.put((seq, frame, data, None))
+            else:
+                self.results.put((seq, frame, None, f"Lỗi từ API: {data.get('status')} - {data.get('error')}"))
+
+    def close(self): # Đóng kết nối WebSocket, thread nhận tự kết thúc
+        self.closed = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
@@ -0,0 +1,125 @@
+import sqlite3
+import queue
+import time
+
+
+def query_operation(sql): # Từ khóa đầu tiên của câu lệnh (SELECT, INSERT...), dùng làm nhãn khi đo thời gian
+    parts = sql.lstrip().split(None, 1)
+    return parts[0].upper() if parts else "UNKNOWN"
+
+
+class TimedCursor:
+    # Bọc cursor sqlite3: đo thời gian execute / fetch rồi báo cho observer(operation, seconds)
+    def __init__(self, cursor, observer):
+        self.cursor = cursor
+        self.observer = observer
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def timed(self, operation, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.observer(operation, time.perf_counter() - started)
+
+    def execute(self, sql, parameters=()):
+        self.timed(query_operation(sql), self.cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.timed(query_operation(sql), self.cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        return self.timed("FETCH", self.cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self.timed("FETCH", self.cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self.timed("FETCH", self.cursor.fetchall)
+
+
+class PooledConnection:
+    # Bọc kết nối sqlite3: close() trả kết nối về pool thay vì đóng thật
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def cursor(self):
+        cursor = self.conn.cursor()
+        return cursor if self.pool.observer is None else TimedCursor(cursor, self.pool.observer)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        if self.pool.observer is None:
+            return self.conn.commit()
+        started = time.perf_counter()
+        try:
+            self.conn.commit()
+        finally:
+            self.pool.observer("COMMIT", time.perf_counter() - started)
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        self.pool.release(conn)
+
+
+class SQLitePool:
+    # Pool kết nối SQLite dùng lại giữa các request, bật WAL và các PRAGMA tối ưu
+    # observer(operation, seconds): nếu có, được gọi sau mỗi câu lệnh / fetch / commit để đo thời gian truy vấn
+    def __init__(self, db_path, max_idle=8, busy_timeout=5.0, mmap_size=256 * 1024 * 1024,
+                 cache_size_kib=16 * 1024, statement_cache=256, observer=None):
+        self.db_path = db_path
+        self.observer = observer
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.statement_cache = statement_cache
+        self.idle = queue.LifoQueue(maxsize=max_idle)
+
+    def connect(self): # Mở kết nối mới và cấu hình PRAGMA
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=self.statement_cache)
+        conn.row_factory = sqlite3.Row
+        # WAL: người đọc không bị chặn bởi người ghi; NORMAL đủ an toàn với WAL và ít fsync hơn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self): # Lấy kết nối rảnh trong pool, hoặc mở mới nếu pool trống
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        return PooledConnection(self, conn)
+
+    def release(self, conn): # Trả kết nối về pool; hủy transaction còn dở, đóng nếu pool đã đầy
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
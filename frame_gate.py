@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+
+
+class FrameChangeGate:
+    # So sánh frame (thu nhỏ, xám) với frame đã gửi gần nhất; thay đổi ít thì không cần gửi lên server
+    def __init__(self, threshold=4.0, size=(64, 48), max_skip=30):
+        self.threshold = threshold  # chênh lệch trung bình mỗi pixel (0-255)
+        self.size = size
+        self.max_skip = max_skip    # bắt buộc gửi lại sau số frame này để cập nhật kết quả
+        self.reference = None
+        self.skipped = 0
+
+    def changed(self, frame): # Trả về (có cần gửi hay không, ảnh thu nhỏ để truyền cho mark_sent)
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = small.astype(np.int16)
+        if self.reference is None or self.skipped >= self.max_skip:
+            return True, small
+        diff = np.abs(small - self.reference).mean()
+        return diff >= self.threshold, small
+
+    def mark_sent(self, small):
+        self.reference = small
+        self.skipped = 0
+
+    def mark_skipped(self):
+        self.skipped += 1
+
+    def reset(self):
+        self.reference = None
+        self.skipped = 0
@@ -0,0 +1,54 @@
+import os
+import importlib.util
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "yolov8n.pt")
+# pytorch | onnx | openvino | stub (model giả cho benchmark, xem benchmarks/stub_model.py)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "pytorch").lower()
+INFERENCE_IMGSZ = int(os.environ.get("INFERENCE_IMGSZ", 640))
+
+# Thư viện runtime cần có cho từng backend (pytorch đi kèm ultralytics)
+BACKEND_RUNTIMES = {
+    "pytorch": None,
+    "onnx": "onnxruntime",
+    "openvino": "openvino",
+    "stub": None,
+}
+
+
+def backend_available(backend): # Kiểm tra backend có dùng được trên máy này không
+    if backend not in BACKEND_RUNTIMES:
+        return False
+    runtime = BACKEND_RUNTIMES[backend]
+    return runtime is None or importlib.util.find_spec(runtime) is not None
+
+
+def exported_model_path(model_path, backend): # Đường dẫn model sau khi export (theo quy ước tên của ultralytics)
+    base, _ = os.path.splitext(model_path)
+    if backend == "onnx":
+        return f"{base}.onnx"
+    if backend == "openvino":
+        return f"{base}_openvino_model"
+    return model_path
+
+
+def export_model(model_path, backend, imgsz=INFERENCE_IMGSZ): # Export model .pt sang ONNX / OpenVINO IR (chỉ làm một lần)
+    target = exported_model_path(model_path, backend)
+    if backend in ("pytorch", "stub") or os.path.exists(target):
+        return target
+    from ultralytics import YOLO
+    # dynamic=True để model export nhận được batch nhiều ảnh (BatchScheduler, video)
+    return YOLO(model_path).export(format=backend, imgsz=imgsz, dynamic=True)
+
+
+def load_model(model_path=MODEL_PATH, backend=INFERENCE_BACKEND, imgsz=INFERENCE_IMGSZ): # Nạp model theo backend đã cấu hình
+    if not backend_available(backend):
+        print(f"Backend {backend} không khả dụng, dùng pytorch.")
+        backend = "pytorch"
+    if backend == "stub":
+        from benchmarks.stub_model import StubModel
+        return StubModel()
+    from ultralytics import YOLO
+    if backend == "pytorch":
+        return YOLO(model_path)
+    # Model export vẫn chạy qua YOLO() nên tiền xử lý / hậu xử lý giống hệt backend pytorch
+    return YOLO(export_model(model_path, backend, imgsz), task="detect")
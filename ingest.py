@@ -0,0 +1,102 @@
+import struct
+import threading
+import cv2
+import numpy as np
+
+# Hệ số giảm khi giải mã JPEG (libjpeg co ảnh ngay trong bước IDCT, rẻ hơn nhiều so với giải mã đầy đủ rồi resize)
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# Các marker SOF chứa kích thước ảnh (bỏ DHT C4, JPG C8, DAC CC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+LETTERBOX_COLOR = 114
+
+# Mỗi thread giữ sẵn một buffer đầu vào cho từng imgsz, dùng lại giữa các request
+_buffers = threading.local()
+
+
+def jpeg_size(data): # Đọc (rộng, cao) từ header JPEG mà không giải mã; None nếu không phải JPEG
+    if data[:2] != b"\xff\xd8":
+        return None
+    i, n = 2, len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def decode_image(data, target_size=None): # Giải mã ảnh, trả về (image, scale); scale = hệ số đổi tọa độ về ảnh gốc
+    # Với JPEG đủ lớn so với target_size, giải mã thẳng ở 1/2, 1/4 hoặc 1/8 độ phân giải
+    buffer = np.frombuffer(data, np.uint8)
+    if target_size:
+        size = jpeg_size(data)
+        if size:
+            longest = max(size)
+            for factor, flag in REDUCED_FLAGS:
+                if longest // factor >= target_size:
+                    image = cv2.imdecode(buffer, flag)
+                    if image is not None:
+                        return image, factor
+                    break
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1
+
+
+def input_buffer(size): # Buffer size x size x 3 của thread hiện tại
+    buffers = getattr(_buffers, "by_size", None)
+    if buffers is None:
+        buffers = _buffers.by_size = {}
+    canvas = buffers.get(size)
+    if canvas is None:
+        canvas = buffers[size] = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    return canvas
+
+
+def letterbox(image, size, out=None): # Co ảnh giữ tỉ lệ vào buffer vuông size x size có sẵn, trả về (canvas, ratio, (pad_x, pad_y))
+    # Không truyền out: canvas được dùng lại ở request sau của cùng thread, chỉ hợp lệ tới khi có kết quả nhận diện
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = min(size, round(width * ratio)), min(size, round(height * ratio))
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    canvas = input_buffer(size) if out is None else out
+    canvas[:pad_y] = LETTERBOX_COLOR
+    canvas[pad_y + new_height:] = LETTERBOX_COLOR
+    canvas[:, :pad_x] = LETTERBOX_COLOR
+    canvas[:, pad_x + new_width:] = LETTERBOX_COLOR
+    region = canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width]
+    if (new_width, new_height) == (width, height):
+        region[...] = image
+    elif region.flags.c_contiguous:
+        # Ảnh ngang: vùng đích là các hàng liền nhau, resize ghi thẳng vào buffer
+        cv2.resize(image, (new_width, new_height), dst=region, interpolation=cv2.INTER_LINEAR)
+    else:
+        region[...] = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    return canvas, ratio, (pad_x, pad_y)
+
+
+def unletterbox(detections, ratio, pad, scale, width, height): # Đổi box từ tọa độ buffer về tọa độ ảnh gốc (width x height)
+    pad_x, pad_y = pad
+    mapped = []
+    for d in detections:
+        x1, y1, x2, y2 = d["box"]
+        mapped.append(dict(d, box=[
+            min(max(int((x1 - pad_x) / ratio * scale), 0), width),
+            min(max(int((y1 - pad_y) / ratio * scale), 0), height),
+            min(max(int((x2 - pad_x) / ratio * scale), 0), width),
+            min(max(int((y2 - pad_y) / ratio * scale), 0), height),
+        ]))
+    return mapped
+
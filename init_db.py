@@ -1,7 +1,56 @@
 import sqlite3
+import json
 
-def init_db():
-    conn = sqlite3.connect("data_images.db")
+DB_PATH = "data_images.db"
+# Tăng khi thay đổi cấu trúc CSDL, lưu trong PRAGMA user_version
+SCHEMA_VERSION = 4
+
+def insert_detections(cursor, image_id, detections): # Ghi detections của một ảnh vào bảng detections
+    cursor.executemany(
+        "INSERT INTO detections (image_id, label, confidence, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(image_id, d["label"], d["confidence"], *d["box"]) for d in detections]
+    )
+
+def migrate_detections(conn): # Chuyển detections dạng JSON trong bảng images sang bảng detections
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, detections FROM images WHERE detections IS NOT NULL")
+    migrated = 0
+    for image_id, detections_json in cursor.fetchall():
+        try:
+            detections = json.loads(detections_json)
+        except ValueError:
+            continue
+        if isinstance(detections, list):
+            insert_detections(cursor, image_id, detections)
+            migrated += 1
+    return migrated
+
+def dedupe_captures(conn): # Gộp các bản ghi ảnh chụp trùng file_path (do hai upload cùng nội dung chạy đồng thời), giữ id nhỏ nhất
+    cursor = conn.cursor()
+    duplicates = [row[0] for row in cursor.execute(
+        "SELECT id FROM images WHERE file_path GLOB '*captured_*' AND id NOT IN "
+        "(SELECT MIN(id) FROM images WHERE file_path GLOB '*captured_*' GROUP BY file_path)"
+    )]
+    for image_id in duplicates:
+        cursor.execute("DELETE FROM detections WHERE image_id = ?", (image_id,))
+        cursor.execute("DELETE FROM images WHERE id = ?", (image_id,))
+    return len(duplicates)
+
+def init_db(db_path=DB_PATH):
+    # Nhiều process có thể khởi động cùng lúc (reloader của Werkzeug, nhiều worker): tạo bảng, đọc user_version
+    # và migrate trong một transaction IMMEDIATE, process đến sau chờ khóa rồi đọc lại phiên bản đã cập nhật
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        create_schema(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def create_schema(conn): # Tạo bảng / index còn thiếu và migrate theo PRAGMA user_version (gọi trong transaction)
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS images (
@@ -11,9 +60,61 @@ def init_db():
             notes TEXT
         )
     """)
-    conn.commit()
-    conn.close()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+            label TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            x1 INTEGER NOT NULL,
+            y1 INTEGER NOT NULL,
+            x2 INTEGER NOT NULL,
+            y2 INTEGER NOT NULL
+        )
+    """)
+    # Hàng đợi job chạy nền (video / batch dài), xem jobs.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            params TEXT,
+            input_path TEXT,
+            result_path TEXT,
+            processed INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            owner TEXT,
+            lease_expires REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detections_label_confidence ON detections (label, confidence)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detections_confidence ON detections (confidence)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detections_image_id ON detections (image_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_file_path ON images (file_path)")
+
+    # CSDL cũ (user_version = 0): chuyển dữ liệu JSON sang bảng detections một lần
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        migrate_detections(conn)
+    # Bảng jobs của schema 2 chưa có cột owner / lease_expires (process đang chạy job và hạn thuê)
+    job_columns = {row[1] for row in cursor.execute("PRAGMA table_info(jobs)")}
+    if "owner" not in job_columns:
+        cursor.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        cursor.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+    # Ảnh chụp phía server đặt tên theo nội dung (captured_<hash>): mỗi file chỉ có một bản ghi, /capture/ dùng INSERT OR IGNORE
+    # Chỉ áp dụng cho ảnh chụp, /save_image/ vẫn nhận file_path tùy ý của client
+    if version < 4:
+        dedupe_captures(conn)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_images_captured_file_path ON images (file_path) "
+                   "WHERE file_path GLOB '*captured_*'")
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 if __name__ == "__main__":
     init_db()
-    print("CSDL đã được khởi tạo thành công.")
\ No newline at end of file
+    print("CSDL đã được khởi tạo thành công.")
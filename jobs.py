@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import shutil
+import socket
+import uuid
+import threading
+
+# Trạng thái job: queued -> running -> done / failed / cancelled
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLost(Exception):
+    # Hết hạn thuê và job đã được trả về hàng đợi cho process khác: bỏ dở, không đụng tới file của job
+    pass
+
+
+class JobContext:
+    # Truyền cho handler: báo tiến độ, kiểm tra yêu cầu hủy, đường dẫn file kết quả
+    def __init__(self, jobs, job_id, update_interval=0.5):
+        self.jobs = jobs
+        self.job_id = job_id
+        self.update_interval = update_interval
+        self.last_update = 0.0
+        # Mỗi lần nhận job ghi vào file tạm riêng, chỉ được đổi thành file kết quả khi còn giữ job (JobQueue.finish)
+        self.temp_prefix = f"{job_id}.{uuid.uuid4().hex}."
+        self.final_path = None
+
+    def result_path(self, extension): # Đường dẫn file tạm để handler ghi kết quả
+        self.final_path = os.path.join(self.jobs.job_dir, f"{self.job_id}.result{extension}")
+        return os.path.join(self.jobs.job_dir, f"{self.temp_prefix}tmp{extension}")
+
+    def remove_temp(self): # Xóa file tạm còn sót (job lỗi, bị hủy hoặc đã mất)
+        for name in os.listdir(self.jobs.job_dir):
+            if name.startswith(self.temp_prefix):
+                os.remove(os.path.join(self.jobs.job_dir, name))
+
+    def update(self, processed, total=None, force=False): # Ghi tiến độ (tối đa mỗi update_interval giây); JobCancelled nếu đã bị hủy
+        now = time.monotonic()
+        if not force and now - self.last_update < self.update_interval:
+            return
+        self.last_update = now
+        conn = self.jobs.db_pool.acquire()
+        try:
+            conn.execute("UPDATE jobs SET processed = ?, total = COALESCE(?, total) WHERE id = ? AND owner = ?",
+                         (processed, total, self.job_id, self.jobs.owner))
+            conn.commit()
+            row = conn.execute("SELECT owner, cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or row["owner"] != self.jobs.owner:
+            raise JobLost()
+        if row["cancel_requested"]:
+            raise JobCancelled()
+
+
+class JobQueue:
+    # Hàng đợi job lưu trong SQLite (bảng jobs), chạy bởi một số thread nền cố định
+    # Worker nhận job bằng transaction IMMEDIATE nên nhiều process dùng chung CSDL không lấy trùng job
+    # Job đang chạy ghi owner (host:pid) và hạn thuê lease_expires, được gia hạn bởi thread heartbeat;
+    # chỉ job hết hạn thuê (process chạy nó đã chết) mới được đưa lại về hàng đợi
+    def __init__(self, db_pool, job_dir, handlers, num_workers=1, poll_interval=1.0, lease_seconds=30.0):
+        self.db_pool = db_pool
+        self.job_dir = job_dir
+        self.handlers = handlers
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = threading.Event()
+        self.running = False
+        self.threads = []
+        os.makedirs(job_dir, exist_ok=True)
+
+    def start(self): # Khởi động worker và thread gia hạn thuê
+        if self.running:
+            return
+        self.running = True
+        targets = [(self.run_worker, f"job-worker-{index}") for index in range(self.num_workers)]
+        targets.append((self.run_heartbeat, "job-heartbeat"))
+        for target, name in targets:
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def submit(self, job_id, kind, params, input_path): # Thêm job vào hàng đợi, trả về job_id
+        if kind not in self.handlers:
+            raise ValueError(f"Loại job không hợp lệ: {kind}")
+        conn = self.db_pool.acquire()
+        try:
+            conn.execute("INSERT INTO jobs (id, kind, status, params, input_path, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                         (job_id, kind, json.dumps(params), input_path, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        conn = self.db_pool.acquire()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self.to_dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        conn = self.db_pool.acquire()
+        try:
+            if status:
+                rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [self.to_dict(row) for row in rows]
+
+    def count(self, status): # Số job đang ở trạng thái status
+        conn = self.db_pool.acquire()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def cancel(self, job_id): # Job đang chờ bị hủy ngay; job đang chạy dừng ở lần báo tiến độ tiếp theo
+        conn = self.db_pool.acquire()
+        try:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,))
+            cursor = conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                                  (time.time(), job_id))
+            conn.commit()
+            if cursor.rowcount > 0:
+                row = conn.execute("SELECT input_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self.remove_input(row["input_path"])
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+    def to_dict(self, row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["progress"] = round(job["processed"] / job["total"], 4) if job["total"] else None
+        if job["status"] == "done":
+            job["progress"] = 1.0
+        del job["input_path"]
+        del job["result_path"]
+        return job
+
+    def result_path(self, job_id): # Đường dẫn file kết quả của job đã xong, None nếu chưa có
+        conn = self.db_pool.acquire()
+        try:
+            row = conn.execute("SELECT status, result_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or row["status"] != "done":
+            return None
+        return row["result_path"]
+
+    def claim_next(self): # Lấy job queued cũ nhất và chuyển sang running trong một transaction
+        conn = self.db_pool.acquire()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # Job running đã hết hạn thuê (process chạy nó tắt giữa chừng) được chạy lại từ đầu
+            conn.execute("UPDATE jobs SET status = 'queued', processed = 0, started_at = NULL, owner = NULL, lease_expires = NULL "
+                         "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)", (now,))
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_expires = ? WHERE id = ?",
+                         (now, self.owner, now + self.lease_seconds, row["id"]))
+            conn.commit()
+            return dict(row)
+        finally:
+            conn.close()
+
+    def renew_leases(self): # Gia hạn thuê cho mọi job process này đang chạy
+        conn = self.db_pool.acquire()
+        try:
+            conn.execute("UPDATE jobs SET lease_expires = ? WHERE status = 'running' AND owner = ?",
+                         (time.time() + self.lease_seconds, self.owner))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def finish(self, job_id, status, result_path=None, error=None, temp_path=None): # False nếu job không còn thuộc process này
+        # temp_path được đổi tên thành result_path trong cùng transaction với việc kiểm tra owner,
+        # nên process đã mất job không ghi đè được kết quả của process đang giữ nó
+        conn = self.db_pool.acquire()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute("UPDATE jobs SET status = ?, result_path = ?, error = ?, finished_at = ?, lease_expires = NULL "
+                                  "WHERE id = ? AND owner = ? AND status = 'running'",
+                                  (status, result_path, error, time.time(), job_id, self.owner))
+            owned = cursor.rowcount > 0
+            if owned and temp_path is not None:
+                os.replace(temp_path, result_path)
+            conn.commit()
+            return owned
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def remove_input(self, input_path): # Xóa file / thư mục đầu vào khi job kết thúc
+        if not input_path or not os.path.exists(input_path):
+            return
+        if os.path.isdir(input_path):
+            shutil.rmtree(input_path, ignore_errors=True)
+        else:
+            os.remove(input_path)
+
+    def run_worker(self): # Vòng lặp của thread worker
+        while self.running:
+            try:
+                job = self.claim_next()
+            except Exception as e:
+                print(f"Lỗi khi lấy job: {e}")
+                job = None
+            if job is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def run_heartbeat(self):
+        while self.running:
+            try:
+                self.renew_leases()
+            except Exception as e:
+                print(f"Lỗi khi gia hạn job: {e}")
+            time.sleep(self.lease_seconds / 3)
+
+    def run_job(self, job):
+        job_id = job["id"]
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        context = JobContext(self, job_id)
+        owned = False
+        try:
+            temp_path = self.handlers[job["kind"]](job, context)
+            owned = self.finish(job_id, "done", result_path=context.final_path if temp_path else None, temp_path=temp_path)
+        except JobLost:
+            print(f"Job {job_id} đã được process khác nhận lại, bỏ dở")
+        except JobCancelled:
+            owned = self.finish(job_id, "cancelled")
+        except Exception as e:
+            owned = self.finish(job_id, "failed", error=str(e))
+        finally:
+            context.remove_temp()
+        # File đầu vào thuộc về process đang giữ job, process đã mất job không được xóa
+        if owned:
+            self.remove_input(job["input_path"])
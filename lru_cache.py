@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Cache LRU có giới hạn số phần tử và thời gian sống (TTL), an toàn khi dùng từ nhiều thread
+    def __init__(self, max_items=128, ttl=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.items[key]
+                self.misses += 1
+                self.evictions += 1
+                return default
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.items[key] = (value, expires_at)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.items.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def stats(self): # Số liệu hit/miss/eviction của cache
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.items),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,161 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Mốc histogram mặc định (giây), từ 0.5 ms tới 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Thời gian từng bước của request hiện tại (cho header Server-Timing)
+_current = threading.local()
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.extend(self.render_value(labels, value))
+        return lines
+
+    def render_value(self, labels, value):
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, value, *labels): # Chép giá trị của bộ đếm có sẵn ở nơi khác (vd. hits của LRUCache)
+        with self.lock:
+            self.values[labels] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                # [số mẫu theo từng mốc (không cộng dồn)..., số mẫu vượt mốc cuối], tổng, số mẫu
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self.lock:
+            items = sorted((labels, [list(entry[0]), entry[1], entry[2]]) for labels, entry in self.values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    # Tập các metric, xuất ra định dạng text của Prometheus (text/plain; version=0.0.4)
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collector): # Hàm được gọi ngay trước khi xuất, dùng để cập nhật gauge (vd. kích thước hàng đợi)
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception:
+                pass
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def begin_timings(): # Bắt đầu ghi thời gian các bước cho request trên thread hiện tại
+    _current.timings = []
+
+
+def end_timings(): # Kết thúc và trả về danh sách (bước, giây) của request hiện tại
+    timings = getattr(_current, "timings", None)
+    _current.timings = None
+    return timings or []
+
+
+def record_timing(name, seconds):
+    timings = getattr(_current, "timings", None)
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def timed(histogram, stage): # Đo thời gian một bước: ghi vào histogram (nhãn stage) và Server-Timing của request
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        histogram.observe(seconds, stage)
+        record_timing(stage, seconds)
+
+
+def server_timing_header(timings): # "decode;dur=1.2, inference;dur=35.0" (mili giây), cộng dồn các bước trùng tên
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
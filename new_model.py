@@ -1,6 +1,10 @@
+import sys
 import numpy as np
-from ultralytics import YOLO
+from inference_backend import MODEL_PATH, INFERENCE_BACKEND, export_model, load_model
 
 print(np.__version__)
 print("Le Danh Tien")
-model = YOLO("yolov8n.pt")
+# python new_model.py [pytorch|onnx|openvino]: export model một lần cho backend được chọn
+backend = sys.argv[1] if len(sys.argv) > 1 else INFERENCE_BACKEND
+print(export_model(MODEL_PATH, backend))
+model = load_model(MODEL_PATH, backend)
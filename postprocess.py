@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def extract_arrays(result): # Lấy xyxy, conf, cls của toàn bộ box dưới dạng mảng NumPy (một lần copy)
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32)
+    data = boxes.data.cpu().numpy()
+    # data: [x1, y1, x2, y2, conf, cls] (hoặc có thêm track id ở cột 4)
+    xyxy = data[:, :4].astype(np.int32)
+    conf = data[:, -2].astype(np.float32)
+    cls = data[:, -1].astype(np.int32)
+    return xyxy, conf, cls
+
+
+def filter_arrays(xyxy, conf, cls, min_confidence=None, class_ids=None): # Lọc theo độ tin cậy và lớp bằng phép toán mảng
+    mask = np.ones(len(conf), dtype=bool)
+    if min_confidence is not None:
+        mask &= conf >= min_confidence
+    if class_ids is not None:
+        mask &= np.isin(cls, list(class_ids))
+    return xyxy[mask], conf[mask], cls[mask]
+
+
+def class_ids_from_labels(names, labels): # Đổi danh sách tên nhãn sang id lớp của model
+    if not labels:
+        return None
+    wanted = set(labels)
+    return [class_id for class_id, name in names.items() if name in wanted]
+
+
+def build_detections(names, xyxy, conf, cls): # Tạo danh sách detections cho response
+    return [
+        {"label": names[class_id], "confidence": confidence, "box": box}
+        for box, confidence, class_id in zip(xyxy.tolist(), conf.tolist(), cls.tolist())
+    ]
+
+
+def extract_detections(result, min_confidence=None, labels=None): # Hậu xử lý một kết quả YOLO
+    xyxy, conf, cls = extract_arrays(result)
+    class_ids = class_ids_from_labels(result.names, labels)
+    xyxy, conf, cls = filter_arrays(xyxy, conf, cls, min_confidence, class_ids)
+    return build_detections(result.names, xyxy, conf, cls)
+
+
+def filter_detections(detections, min_confidence=None, labels=None): # Lọc danh sách detections đã có (vd. lấy từ cache)
+    if min_confidence is None and not labels:
+        return detections
+    wanted = set(labels) if labels else None
+    return [
+        d for d in detections
+        if (min_confidence is None or d["confidence"] >= min_confidence) and (wanted is None or d["label"] in wanted)
+    ]
@@ -0,0 +1,39 @@
+import hashlib
+import cv2
+import numpy as np
+from lru_cache import LRUCache
+
+
+def exact_key(image): # Hash nhanh (BLAKE2b) trên bytes ảnh đã giải mã
+    digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).hexdigest()
+    return f"x:{image.shape[1]}x{image.shape[0]}:{digest}"
+
+
+def perceptual_key(image): # dHash 64 bit: ảnh gần giống nhau (nhiễu nén, thay đổi nhỏ) cho cùng khóa
+    # Kèm kích thước ảnh như exact_key: box trong cache tính theo tọa độ của ảnh gốc
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return f"p:{image.shape[1]}x{image.shape[0]}:{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+class DetectionResultCache:
+    # Cache kết quả nhận diện theo nội dung ảnh (LRU + TTL, có giới hạn số phần tử)
+    def __init__(self, max_items=1024, ttl=60, perceptual=False):
+        self.perceptual = perceptual
+        self.cache = LRUCache(max_items=max_items, ttl=ttl)
+
+    def key(self, image, extra=None):
+        key = perceptual_key(image) if self.perceptual else exact_key(image)
+        return key if extra is None else f"{key}|{extra}"
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, detections):
+        self.cache.put(key, detections)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["perceptual"] = self.perceptual
+        return stats
@@ -0,0 +1,57 @@
+import time
+import pytest
+from admission import AdmissionController, AdmissionRejected, DeadlineExceeded, parse_deadline, check_deadline, remaining
+
+
+def test_global_limit_rejects_with_503():
+    admission = AdmissionController(max_in_flight=2, max_per_client=0, retry_after=3)
+    admission.admit("a")
+    admission.admit("b")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit("c")
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after == 3
+    assert admission.stats()["rejected"] == {429: 0, 503: 1}
+
+
+def test_per_client_limit_rejects_with_429():
+    admission = AdmissionController(max_in_flight=10, max_per_client=1, retry_after=2)
+    admission.admit("a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit("a")
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after == 2
+    # Client khác vẫn được nhận
+    admission.admit("b")
+    assert admission.stats()["in_flight"] == 2
+
+
+def test_release_frees_slot():
+    admission = AdmissionController(max_in_flight=1, max_per_client=1)
+    admission.admit("a")
+    admission.release("a")
+    stats = admission.stats()
+    assert stats["in_flight"] == 0
+    assert stats["clients"] == 0
+    admission.admit("a")
+
+
+def test_zero_means_unlimited():
+    admission = AdmissionController(max_in_flight=0, max_per_client=0)
+    for _ in range(100):
+        admission.admit("a")
+    assert admission.stats()["in_flight"] == 100
+
+
+def test_deadline_helpers():
+    assert parse_deadline(None) is None
+    assert parse_deadline("abc") is None
+    assert parse_deadline("0") is None
+    deadline = parse_deadline("200")
+    assert 0 < remaining(deadline) <= 0.2
+    assert remaining(deadline, default=0.05) == 0.05
+    assert remaining(None, default=7) == 7
+    check_deadline(deadline)
+    with pytest.raises(DeadlineExceeded):
+        check_deadline(time.monotonic() - 1)
+    assert remaining(time.monotonic() - 1) == 0.0
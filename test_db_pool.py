@@ -0,0 +1,74 @@
+from db_pool import SQLitePool, TimedCursor, query_operation
+
+
+def test_connection_is_reused(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.acquire()
+    raw = conn.conn
+    conn.close()
+    # close() lần hai không trả kết nối về pool thêm lần nữa
+    conn.close()
+    assert pool.idle.qsize() == 1
+    again = pool.acquire()
+    assert again.conn is raw
+    again.close()
+    pool.close_all()
+
+
+def test_pragmas(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.acquire()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+    finally:
+        conn.close()
+        pool.close_all()
+
+
+def test_release_rolls_back_open_transaction(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"))
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    conn = pool.acquire()
+    try:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    finally:
+        conn.close()
+        pool.close_all()
+
+
+def test_pool_closes_connections_beyond_max_idle(tmp_path):
+    pool = SQLitePool(str(tmp_path / "pool.db"), max_idle=1)
+    first, second = pool.acquire(), pool.acquire()
+    first.close()
+    second.close()
+    assert pool.idle.qsize() == 1
+    pool.close_all()
+    assert pool.idle.qsize() == 0
+
+
+def test_observer_times_statements(tmp_path):
+    observed = []
+    pool = SQLitePool(str(tmp_path / "pool.db"), observer=lambda operation, seconds: observed.append(operation))
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute("CREATE TABLE t (x INTEGER)")
+        assert isinstance(cursor, TimedCursor)
+        conn.execute("INSERT INTO t VALUES (?)", (1,))
+        conn.commit()
+        assert conn.execute("  select x FROM t").fetchall()[0]["x"] == 1
+    finally:
+        conn.close()
+        pool.close_all()
+    assert observed == ["CREATE", "INSERT", "COMMIT", "SELECT", "FETCH"]
+
+
+def test_query_operation():
+    assert query_operation("\n  update jobs SET x = 1") == "UPDATE"
+    assert query_operation("") == "UNKNOWN"
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+from ingest import jpeg_size, decode_image, letterbox, unletterbox, LETTERBOX_COLOR
+
+
+def encode_jpeg(width, height):
+    image = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+def test_jpeg_size_reads_header():
+    assert jpeg_size(encode_jpeg(640, 480)) == (640, 480)
+    assert jpeg_size(encode_jpeg(123, 457)) == (123, 457)
+
+
+def test_jpeg_size_rejects_other_formats():
+    png = cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+    assert jpeg_size(png) is None
+    assert jpeg_size(b"") is None
+    assert jpeg_size(b"\xff\xd8\xff") is None
+
+
+def test_decode_image_reduced():
+    image, scale = decode_image(encode_jpeg(1280, 960), target_size=320)
+    assert scale == 4
+    assert image.shape == (240, 320, 3)
+    image, scale = decode_image(encode_jpeg(320, 240), target_size=640)
+    assert scale == 1
+    assert image.shape == (240, 320, 3)
+
+
+@pytest.mark.parametrize("width, height", [(640, 480), (480, 640), (320, 320), (1000, 200)])
+def test_letterbox_pads_to_square(width, height):
+    image = np.full((height, width, 3), 200, np.uint8)
+    canvas, ratio, (pad_x, pad_y) = letterbox(image, 320, out=np.empty((320, 320, 3), np.uint8))
+    assert canvas.shape == (320, 320, 3)
+    assert ratio == min(320 / width, 320 / height)
+    new_width, new_height = 320 - 2 * pad_x, 320 - 2 * pad_y
+    assert abs(new_width - width * ratio) <= 1 and abs(new_height - height * ratio) <= 1
+    assert (canvas[:pad_y] == LETTERBOX_COLOR).all()
+    assert (canvas[:, :pad_x] == LETTERBOX_COLOR).all()
+    assert (canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width] == 200).all()
+
+
+def test_letterbox_reuses_thread_buffer():
+    first, _, _ = letterbox(np.zeros((240, 320, 3), np.uint8), 160)
+    second, _, _ = letterbox(np.zeros((320, 240, 3), np.uint8), 160)
+    assert first is second
+
+
+@pytest.mark.parametrize("scale", [1, 2])
+def test_unletterbox_round_trip(scale):
+    # Box trên ảnh gốc 1280x720, ảnh giải mã ở 1/scale rồi letterbox về 640
+    width, height = 1280, 720
+    image = np.zeros((height // scale, width // scale, 3), np.uint8)
+    _, ratio, (pad_x, pad_y) = letterbox(image, 640)
+    box = [100, 50, 900, 700]
+    letterboxed = [
+        box[0] / scale * ratio + pad_x, box[1] / scale * ratio + pad_y,
+        box[2] / scale * ratio + pad_x, box[3] / scale * ratio + pad_y,
+    ]
+    mapped = unletterbox([{"label": "car", "confidence": 0.9, "box": letterboxed}], ratio, (pad_x, pad_y), scale, width, height)
+    assert mapped[0]["label"] == "car"
+    for original, restored in zip(box, mapped[0]["box"]):
+        assert abs(original - restored) <= scale
+
+
+def test_unletterbox_clamps_to_image():
+    mapped = unletterbox([{"box": [-50, -50, 700, 700]}], 0.5, (0, 80), 1, 1280, 960)
+    assert mapped[0]["box"] == [0, 0, 1280, 960]
@@ -0,0 +1,88 @@
+import json
+import sqlite3
+import multiprocessing
+from init_db import init_db, SCHEMA_VERSION
+
+
+def create_old_database(path, images): # CSDL phiên bản 0: detections lưu dạng JSON trong bảng images
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE images (id INTEGER PRIMARY KEY AUTOINCREMENT, file_path TEXT NOT NULL, detections TEXT, notes TEXT)")
+    conn.executemany("INSERT INTO images (file_path, detections, notes) VALUES (?, ?, ?)", images)
+    conn.commit()
+    conn.close()
+
+
+def old_images(count):
+    detections = [{"label": "car", "confidence": 0.9, "box": [1, 2, 3, 4]},
+                  {"label": "person", "confidence": 0.5, "box": [5, 6, 7, 8]}]
+    return [(f"images/{i}.jpg", json.dumps(detections), None) for i in range(count)]
+
+
+def count_rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_new_database(tmp_path):
+    path = str(tmp_path / "new.db")
+    init_db(path)
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"images", "detections", "jobs"} <= tables
+        job_columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        assert {"owner", "lease_expires"} <= job_columns
+    finally:
+        conn.close()
+
+
+def test_migration_is_idempotent(tmp_path):
+    path = str(tmp_path / "old.db")
+    create_old_database(path, old_images(5))
+    init_db(path)
+    init_db(path)
+    assert count_rows(path, "detections") == 10
+    assert count_rows(path, "images") == 5
+
+
+def test_dedupes_captures(tmp_path):
+    path = str(tmp_path / "captures.db")
+    create_old_database(path, [("images/captured_abc.jpg", "[]", None),
+                               ("images/captured_abc.jpg", "[]", None),
+                               ("images/upload.jpg", "[]", None),
+                               ("images/upload.jpg", "[]", None)])
+    init_db(path)
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT id, file_path FROM images ORDER BY id").fetchall()
+        # Chỉ ảnh chụp bị gộp (giữ id nhỏ nhất), ảnh lưu qua /save_image/ giữ nguyên
+        assert rows == [(1, "images/captured_abc.jpg"), (3, "images/upload.jpg"), (4, "images/upload.jpg")]
+        cursor = conn.execute("INSERT OR IGNORE INTO images (file_path) VALUES ('images/captured_abc.jpg')")
+        assert cursor.rowcount == 0
+    finally:
+        conn.close()
+
+
+def run_init_db(path, start):
+    start.wait()
+    init_db(path)
+
+
+def test_concurrent_migration_runs_once(tmp_path):
+    # Nhiều process khởi động cùng lúc trên CSDL cũ: chỉ một process migrate, detections không bị chèn trùng
+    path = str(tmp_path / "race.db")
+    create_old_database(path, old_images(200))
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    processes = [ctx.Process(target=run_init_db, args=(path, start)) for _ in range(6)]
+    for process in processes:
+        process.start()
+    start.set()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * len(processes)
+    assert count_rows(path, "detections") == 400
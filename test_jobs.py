@@ -0,0 +1,187 @@
+import os
+import time
+import pytest
+from db_pool import SQLitePool
+from init_db import init_db
+from jobs import JobQueue
+
+
+@pytest.fixture
+def db_pool(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    init_db(path)
+    pool = SQLitePool(path)
+    yield pool
+    pool.close_all()
+
+
+def make_queue(db_pool, tmp_path, handlers, owner):
+    jobs = JobQueue(db_pool, str(tmp_path / "jobs"), handlers, lease_seconds=30.0)
+    # Giả lập process khác bằng owner khác nhau trên cùng CSDL
+    jobs.owner = owner
+    return jobs
+
+
+def write_input(tmp_path, name="input.mp4"):
+    path = tmp_path / name
+    path.write_bytes(b"data")
+    return str(path)
+
+
+def expire_lease(db_pool, job_id):
+    conn = db_pool.acquire()
+    try:
+        conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ?", (time.time() - 1, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_submit_rejects_unknown_kind(db_pool, tmp_path):
+    jobs = make_queue(db_pool, tmp_path, {"video": None}, "a:1")
+    with pytest.raises(ValueError):
+        jobs.submit("job1", "batch", {}, None)
+
+
+def test_claim_takes_oldest_job_once(db_pool, tmp_path):
+    jobs = make_queue(db_pool, tmp_path, {"video": None}, "a:1")
+    other = make_queue(db_pool, tmp_path, {"video": None}, "b:1")
+    jobs.submit("job1", "video", {"fps": 5}, None)
+    time.sleep(0.01)
+    jobs.submit("job2", "video", {}, None)
+    assert jobs.claim_next()["id"] == "job1"
+    assert other.claim_next()["id"] == "job2"
+    assert jobs.claim_next() is None
+    job = jobs.get("job1")
+    assert job["status"] == "running"
+    assert job["owner"] == "a:1"
+    assert job["params"] == {"fps": 5}
+    assert job["lease_expires"] > time.time()
+
+
+def test_expired_lease_is_requeued(db_pool, tmp_path):
+    jobs = make_queue(db_pool, tmp_path, {"video": None}, "a:1")
+    other = make_queue(db_pool, tmp_path, {"video": None}, "b:1")
+    jobs.submit("job1", "video", {}, None)
+    jobs.claim_next()
+    # Còn hạn thuê: process khác không lấy được
+    assert other.claim_next() is None
+    expire_lease(db_pool, "job1")
+    assert other.claim_next()["id"] == "job1"
+    assert jobs.get("job1")["owner"] == "b:1"
+
+
+def test_renew_leases_only_own_jobs(db_pool, tmp_path):
+    jobs = make_queue(db_pool, tmp_path, {"video": None}, "a:1")
+    other = make_queue(db_pool, tmp_path, {"video": None}, "b:1")
+    jobs.submit("job1", "video", {}, None)
+    jobs.claim_next()
+    expire_lease(db_pool, "job1")
+    other.renew_leases()
+    assert jobs.get("job1")["lease_expires"] < time.time()
+    jobs.renew_leases()
+    assert jobs.get("job1")["lease_expires"] > time.time()
+
+
+def test_run_job_writes_result_and_removes_input(db_pool, tmp_path):
+    def handler(job, context):
+        context.update(1, total=1, force=True)
+        temp_path = context.result_path(".json")
+        with open(temp_path, "w") as f:
+            f.write("{}")
+        return temp_path
+
+    jobs = make_queue(db_pool, tmp_path, {"video": handler}, "a:1")
+    input_path = write_input(tmp_path)
+    jobs.submit("job1", "video", {}, input_path)
+    jobs.run_job(jobs.claim_next())
+    job = jobs.get("job1")
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+    result_path = jobs.result_path("job1")
+    assert result_path == os.path.join(jobs.job_dir, "job1.result.json")
+    assert os.listdir(jobs.job_dir) == ["job1.result.json"]
+    assert not os.path.exists(input_path)
+
+
+def test_run_job_records_failure(db_pool, tmp_path):
+    def handler(job, context):
+        context.result_path(".json")
+        raise RuntimeError("boom")
+
+    jobs = make_queue(db_pool, tmp_path, {"video": handler}, "a:1")
+    jobs.submit("job1", "video", {}, write_input(tmp_path))
+    jobs.run_job(jobs.claim_next())
+    job = jobs.get("job1")
+    assert job["status"] == "failed"
+    assert job["error"] == "boom"
+    assert jobs.result_path("job1") is None
+
+
+def test_cancel_running_job(db_pool, tmp_path):
+    def handler(job, context):
+        jobs.cancel(job["id"])
+        context.update(1, force=True)
+
+    jobs = make_queue(db_pool, tmp_path, {"video": handler}, "a:1")
+    jobs.submit("job1", "video", {}, None)
+    jobs.run_job(jobs.claim_next())
+    assert jobs.get("job1")["status"] == "cancelled"
+
+
+def test_cancel_queued_job_removes_input(db_pool, tmp_path):
+    jobs = make_queue(db_pool, tmp_path, {"video": None}, "a:1")
+    input_path = write_input(tmp_path)
+    jobs.submit("job1", "video", {}, input_path)
+    assert jobs.cancel("job1")["status"] == "cancelled"
+    assert not os.path.exists(input_path)
+    assert jobs.claim_next() is None
+
+
+def test_lost_job_keeps_input_and_result_of_new_owner(db_pool, tmp_path):
+    # Process cũ bị coi là chết (hết hạn thuê) trong lúc đang chạy; process mới nhận lại job.
+    # Process cũ phải dừng ở lần báo tiến độ tiếp theo mà không xóa file đầu vào hay ghi kết quả
+    def handler(job, context):
+        temp_path = context.result_path(".json")
+        with open(temp_path, "w") as f:
+            f.write("stale")
+        expire_lease(db_pool, job["id"])
+        claimed.append(new_owner.claim_next())
+        context.update(1, force=True)
+        lost.append(job["id"])
+
+    claimed, lost = [], []
+    old_owner = make_queue(db_pool, tmp_path, {"video": handler}, "a:1")
+    new_owner = make_queue(db_pool, tmp_path, {"video": handler}, "b:1")
+    input_path = write_input(tmp_path)
+    old_owner.submit("job1", "video", {}, input_path)
+    old_owner.run_job(old_owner.claim_next())
+
+    # update() báo JobLost nên handler không chạy tiếp
+    assert claimed[0]["id"] == "job1"
+    assert lost == []
+    assert os.path.exists(input_path)
+    job = old_owner.get("job1")
+    assert job["status"] == "running"
+    assert job["owner"] == "b:1"
+    # File tạm của process cũ đã bị dọn, không có file kết quả nào
+    assert os.listdir(old_owner.job_dir) == []
+
+
+def test_finish_by_lost_owner_does_not_replace_result(db_pool, tmp_path):
+    jobs = make_queue(db_pool, tmp_path, {"video": None}, "a:1")
+    other = make_queue(db_pool, tmp_path, {"video": None}, "b:1")
+    jobs.submit("job1", "video", {}, None)
+    jobs.claim_next()
+    expire_lease(db_pool, "job1")
+    other.claim_next()
+
+    result_path = os.path.join(jobs.job_dir, "job1.result.json")
+    temp_path = os.path.join(jobs.job_dir, "stale.tmp.json")
+    with open(temp_path, "w") as f:
+        f.write("stale")
+    assert jobs.finish("job1", "done", result_path=result_path, temp_path=temp_path) is False
+    assert not os.path.exists(result_path)
+    assert jobs.get("job1")["status"] == "running"
+    assert other.finish("job1", "done") is True
+    assert other.get("job1")["status"] == "done"
@@ -0,0 +1,49 @@
+import time
+from lru_cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    # Đọc "a" để "b" thành phần tử cũ nhất
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    cache = LRUCache(max_items=4, ttl=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_put_refreshes_ttl_and_pop():
+    cache = LRUCache(max_items=4, ttl=0.1)
+    cache.put("a", 1)
+    time.sleep(0.06)
+    cache.put("a", 2)
+    time.sleep(0.06)
+    assert cache.get("a") == 2
+    assert cache.pop("a") == 2
+    assert cache.pop("a", "missing") == "missing"
+
+
+def test_hit_rate():
+    cache = LRUCache()
+    assert cache.stats()["hit_rate"] == 0.0
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert cache.stats()["hit_rate"] == 0.5
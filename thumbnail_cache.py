@@ -0,0 +1,30 @@
+import os
+import hashlib
+import threading
+from PIL import Image
+
+THUMBNAIL_CACHE_DIR = "thumbnail_cache"
+
+
+def thumbnail_cache_path(file_path, size, cache_dir=THUMBNAIL_CACHE_DIR): # Khóa cache theo đường dẫn, mtime và kích thước
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{size[0]}x{size[1]}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+
+
+def get_thumbnail_path(file_path, size=(80, 60), cache_dir=THUMBNAIL_CACHE_DIR): # Trả về file thumbnail, tạo một lần nếu chưa có
+    cache_path = thumbnail_cache_path(file_path, size, cache_dir)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with Image.open(file_path) as img:
+        # Với JPEG, draft() cho phép giải mã ở độ phân giải thấp thay vì đọc full ảnh
+        img.draft("RGB", (size[0] * 2, size[1] * 2))
+        thumb = img.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+
+    # Ghi ra file tạm rồi đổi tên để không đọc phải file đang ghi dở
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    thumb.save(tmp_path, "JPEG", quality=85)
+    os.replace(tmp_path, cache_path)
+    return cache_path
@@ -0,0 +1,46 @@
+import queue
+
+
+class UIUpdateQueue:
+    # Hàng đợi cập nhật giao diện: thread worker chỉ put(), thread Tk drain định kỳ bằng root.after
+    # Mỗi lần drain chỉ áp dụng cập nhật mới nhất của mỗi loại (các frame trung gian bị gộp bỏ)
+    def __init__(self, root, handler, refresh_hz=30, maxsize=8):
+        self.root = root
+        self.handler = handler
+        self.interval_ms = max(1, int(1000 / refresh_hz))
+        self.updates = queue.Queue(maxsize=maxsize)
+        self.after_id = None
+
+    def put(self, kind, payload=None): # Gọi từ thread bất kỳ; khi đầy thì bỏ cập nhật cũ nhất
+        while True:
+            try:
+                self.updates.put_nowait((kind, payload))
+                return
+            except queue.Full:
+                try:
+                    self.updates.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def start(self): # Bắt đầu vòng drain trên thread Tk
+        if self.after_id is None:
+            self.after_id = self.root.after(self.interval_ms, self.drain)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def drain(self): # Lấy hết cập nhật đang chờ, gộp theo loại rồi áp dụng theo thứ tự xuất hiện cuối
+        latest = {}
+        while True:
+            try:
+                kind, payload = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            latest.pop(kind, None)
+            latest[kind] = payload
+        # Hẹn lần drain tiếp theo trước, để lỗi trong handler không làm dừng vòng cập nhật
+        self.after_id = self.root.after(self.interval_ms, self.drain)
+        for kind, payload in latest.items():
+            self.handler(kind, payload)
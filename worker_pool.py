@@ -0,0 +1,271 @@
+import os
+import time
+import queue
+import atexit
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import numpy as np
+
+# Biến giới hạn số thread của thư viện tính toán (OpenMP / MKL / OpenBLAS)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+_env_lock = threading.Lock()
+
+
+def attach_slot(name): # Process con gắn vào vùng shared memory do process cha tạo
+    shm = shared_memory.SharedMemory(name=name)
+    # Process cha chịu trách nhiệm unlink, process con không đăng ký với resource tracker
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def start_with_thread_env(process, num_threads): # Khởi động process spawn với biến giới hạn thread trong môi trường
+    # Process con spawn import lại module chính (kéo theo numpy) trước khi chạy worker_main, đặt biến ở đó là quá muộn;
+    # process con nhận bản sao os.environ lúc start() nên đặt tạm ở process cha rồi khôi phục
+    with _env_lock:
+        saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+        os.environ.update({name: str(num_threads) for name in THREAD_ENV_VARS})
+        try:
+            process.start()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+def worker_main(worker_index, slot_names, task_queue, result_queue, model_path, backend, imgsz, num_threads, cpus):
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    from inference_backend import load_model
+    from postprocess import extract_detections
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    model = load_model(model_path, backend, imgsz)
+    slots = [attach_slot(name) for name in slot_names]
+    result_queue.put(("ready", worker_index))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, slot_index, shape, dtype, task_imgsz = task
+        try:
+            # Đọc frame trực tiếp từ shared memory, không copy / pickle
+            image = np.ndarray(shape, dtype=dtype, buffer=slots[slot_index].buf)
+            started = time.perf_counter()
+            results = model(image) if task_imgsz is None else model(image, imgsz=task_imgsz)
+            seconds = time.perf_counter() - started
+            detections = extract_detections(results[0])
+            del image
+            result_queue.put(("result", task_id, detections, None, seconds))
+        except Exception as e:
+            result_queue.put(("result", task_id, None, str(e), None))
+
+    for shm in slots:
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+
+class ModelWorkerPool:
+    # N process nhận diện, mỗi process có model riêng và số thread cố định
+    # Frame được copy một lần vào slot shared memory, process con đọc trực tiếp dạng mảng NumPy
+    # Mỗi worker có hàng đợi task riêng nên biết task nào đang ở worker nào: worker chết (OOM, segfault)
+    # thì các Future của nó bị báo lỗi, slot được trả lại và worker được khởi động lại
+    def __init__(self, num_workers, model_path, backend, imgsz, threads_per_worker=1,
+                 slots_per_worker=2, slot_bytes=8 * 1024 * 1024, pin_cpus=False, watch_interval=1.0, on_batch=None):
+        # on_batch(batch_size, seconds): như BatchScheduler, gọi sau mỗi lần worker chạy model (mỗi task là batch 1 ảnh)
+        self.on_batch = on_batch
+        self.ctx = multiprocessing.get_context("spawn")
+        self.slot_bytes = slot_bytes
+        self.slots = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                      for _ in range(num_workers * slots_per_worker)]
+        self.free_slots = queue.Queue()
+        for slot_index in range(len(self.slots)):
+            self.free_slots.put(slot_index)
+
+        self.task_queues = [self.ctx.Queue() for _ in range(num_workers)]
+        self.result_queue = self.ctx.Queue()
+        # task_id -> (Future, slot, worker); assigned[worker] = các task_id đang ở worker đó
+        self.pending = {}
+        self.assigned = [set() for _ in range(num_workers)]
+        self.lock = threading.Lock()
+        self.ready_changed = threading.Condition(self.lock)
+        self.ready = set()
+        self.task_ids = itertools.count()
+        self.restarts = 0
+        self.watch_interval = watch_interval
+        self.closed = False
+
+        slot_names = [shm.name for shm in self.slots]
+        cpu_count = os.cpu_count() or 1
+        self.worker_args = []
+        self.processes = [None] * num_workers
+        for worker_index in range(num_workers):
+            # Mỗi worker dùng một dải CPU riêng khi bật pin_cpus
+            cpus = None
+            if pin_cpus:
+                first = (worker_index * threads_per_worker) % cpu_count
+                cpus = {(first + i) % cpu_count for i in range(threads_per_worker)}
+            self.worker_args.append((slot_names, model_path, backend, imgsz, threads_per_worker, cpus))
+            self.start_worker(worker_index)
+
+        self.listener = threading.Thread(target=self.collect_results, name="model-worker-results")
+        self.listener.daemon = True
+        self.listener.start()
+        self.watchdog = threading.Thread(target=self.watch_workers, name="model-worker-watchdog")
+        self.watchdog.daemon = True
+        self.watchdog.start()
+        atexit.register(self.close)
+
+    @property
+    def ready_workers(self): # Số worker đã nạp xong model
+        return len(self.ready)
+
+    def start_worker(self, worker_index):
+        slot_names, model_path, backend, imgsz, threads_per_worker, cpus = self.worker_args[worker_index]
+        process = self.ctx.Process(
+            target=worker_main,
+            args=(worker_index, slot_names, self.task_queues[worker_index], self.result_queue,
+                  model_path, backend, imgsz, threads_per_worker, cpus),
+            name=f"model-worker-{worker_index}",
+            daemon=True
+        )
+        start_with_thread_env(process, threads_per_worker)
+        self.processes[worker_index] = process
+
+    def submit(self, image, imgsz=None, timeout=None, worker_index=None): # Copy frame vào slot trống rồi gửi task cho worker, trả về Future chứa detections
+        # timeout: thời gian chờ slot trống tối đa (FutureTimeout nếu hết); worker_index: gửi cho worker chỉ định
+        image = np.ascontiguousarray(image)
+        if image.nbytes > self.slot_bytes:
+            raise ValueError(f"Ảnh quá lớn cho worker pool ({image.nbytes} > {self.slot_bytes} bytes)")
+        try:
+            slot_index = self.free_slots.get(timeout=timeout)
+        except queue.Empty:
+            raise FutureTimeout("Không có slot trống trong worker pool")
+        np.ndarray(image.shape, dtype=image.dtype, buffer=self.slots[slot_index].buf)[...] = image
+
+        future = Future()
+        task_id = next(self.task_ids)
+        with self.lock:
+            if worker_index is None:
+                # Ưu tiên worker đã sẵn sàng và đang giữ ít task nhất
+                worker_index = min(range(len(self.processes)),
+                                   key=lambda i: (i not in self.ready, len(self.assigned[i])))
+            self.pending[task_id] = (future, slot_index, worker_index)
+            self.assigned[worker_index].add(task_id)
+            self.task_queues[worker_index].put((task_id, slot_index, image.shape, image.dtype.str, imgsz))
+        return future
+
+    def predict(self, image, imgsz=None, timeout=None):
+        return self.submit(image, imgsz, timeout=timeout).result(timeout=timeout)
+
+    def predict_many(self, images, imgsz=None, timeout=None): # Gửi nhiều frame cùng lúc để các worker xử lý song song
+        futures = [self.submit(image, imgsz, timeout=timeout) for image in images]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def warm_up(self, image, imgsz=None, timeout=None): # Gửi một frame cho từng worker và chờ tất cả trả kết quả
+        futures = [self.submit(image, imgsz, timeout=timeout, worker_index=index) for index in range(len(self.processes))]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def wait_ready(self, timeout=None): # Chờ mọi worker nạp xong model, False nếu hết thời gian
+        with self.ready_changed:
+            return self.ready_changed.wait_for(lambda: len(self.ready) == len(self.processes), timeout)
+
+    def collect_results(self): # Thread nhận kết quả từ các worker, trả slot và hoàn thành Future
+        while True:
+            message = self.result_queue.get()
+            if message is None:
+                break
+            if message[0] == "ready":
+                with self.ready_changed:
+                    self.ready.add(message[1])
+                    self.ready_changed.notify_all()
+                continue
+            _, task_id, detections, error, seconds = message
+            if seconds is not None and self.on_batch is not None:
+                self.on_batch(1, seconds)
+            with self.lock:
+                entry = self.pending.pop(task_id, None)
+                if entry is not None:
+                    self.assigned[entry[2]].discard(task_id)
+            # Task của worker đã bị coi là chết: Future đã được báo lỗi, slot đã được trả
+            if entry is None:
+                continue
+            future, slot_index, _ = entry
+            self.free_slots.put(slot_index)
+            # Future đã bị hủy (request hết thời hạn): bỏ kết quả; chuyển sang RUNNING một cách nguyên tử
+            # để cancel() gọi từ thread request sau đó không làm set_result lỗi và chết thread này
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(detections)
+
+    def watch_workers(self): # Thread kiểm tra các worker còn sống
+        while not self.closed:
+            time.sleep(self.watch_interval)
+            for worker_index, process in enumerate(self.processes):
+                if not self.closed and not process.is_alive():
+                    try:
+                        self.restart_worker(worker_index)
+                    except Exception as e:
+                        print(f"Lỗi khi khởi động lại worker {worker_index}: {e}")
+
+    def restart_worker(self, worker_index): # Báo lỗi các task của worker đã chết, trả slot rồi chạy worker mới
+        with self.lock:
+            process = self.processes[worker_index]
+            self.ready.discard(worker_index)
+            lost = [self.pending.pop(task_id) for task_id in self.assigned[worker_index] if task_id in self.pending]
+            self.assigned[worker_index] = set()
+            # Hàng đợi cũ có thể còn task chưa được nhận, worker mới dùng hàng đợi mới
+            old_queue = self.task_queues[worker_index]
+            self.task_queues[worker_index] = self.ctx.Queue()
+            self.restarts += 1
+        print(f"Worker nhận diện {worker_index} đã dừng (exit code {process.exitcode}), đang khởi động lại")
+        old_queue.cancel_join_thread()
+        old_queue.close()
+        for future, slot_index, _ in lost:
+            # Process đã chết nên không còn đọc slot
+            self.free_slots.put(slot_index)
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError(f"Worker nhận diện {worker_index} đã dừng đột ngột"))
+        self.start_worker(worker_index)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": len(self.processes),
+                "ready_workers": len(self.ready),
+                "pending": len(self.pending),
+                "restarts": self.restarts,
+            }
+
+    def close(self): # Dừng các worker và giải phóng shared memory
+        if self.closed:
+            return
+        self.closed = True
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.result_queue.put(None)
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()